@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""
+Benchmark domain substitution and binary pruning on a synthetic source tree.
+
+The synthetic tree is generated from the paths in pruning.list and domain_substitution.list,
+so it has the same directory layout and file counts as a real source tree. File sizes are
+sampled from log-normal distributions approximating Chromium's source files and binaries,
+and the files to domain substitute contain domains matching domain_regex.list.
+No network access is needed.
+
+The timings are written as JSON so that they can be compared between commits.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utils'))
+from _common import ENCODING, add_common_params, get_logger, set_logging_level
+from domain_substitution import apply_substitution, revert_substitution
+from prune_binaries import CONTINGENT_PATHS, KEEP_SUFFIXES, prune_dirs, prune_files
+
+sys.path.pop(0)
+
+_ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Median size in bytes and sigma of the log-normal distributions of file sizes
+_SOURCE_SIZE_DISTRIBUTION = (6144, 1.2)
+_BINARY_SIZE_DISTRIBUTION = (16384, 1.8)
+_MAX_FILE_SIZE = 8 * 1024 * 1024
+
+# Lines of the synthetic files to domain substitute
+_SOURCE_LINES = (
+    '// Copyright 2024 The Chromium Authors\n',
+    '#include "base/memory/raw_ptr.h"\n',
+    '  return std::make_unique<Delegate>(std::move(callback), weak_factory_.GetWeakPtr());\n',
+    '  for (size_t i = 0; i < entries.size(); ++i) {\n',
+    '    DCHECK_CALLED_ON_VALID_SEQUENCE(sequence_checker_);\n',
+    '}\n',
+    '\n',
+    'const kPreferenceName = \'browser.enable_spellchecking\';\n',
+    '  <message name="IDS_SETTINGS_TITLE" desc="Title of the settings page">\n',
+)
+_DOMAIN_LINES = (
+    'const char kUrl[] = "https://www.google.com/search?q=";\n',
+    '  "https://clients2.googleusercontent.com/crx/blobs/",\n',
+    '// See https://crbug.com/1234567 and https://chromium.googlesource.com/chromium/src\n',
+    '<link href="https://fonts.googleapis.com/css?family=Roboto" rel="stylesheet">\n',
+    '  url = "https://update.googleapis.com/service/update2/json"\n',
+    'https://www.gstatic.com/chrome/intelligence/assist/ranker/models/\n',
+    '# https://goo.gl/abcdef\n',
+)
+_NON_ASCII_LINE = '// Überprüfung der Zeichenkodierung: café, naïve, 日本語\n'
+
+# Files created in each contingent path, and the fraction of __pycache__ directories
+_CONTINGENT_FILES = 8
+_PYCACHE_FRACTION = 0.02
+
+
+def _sample_size(random_state, distribution, size_scale):
+    """Returns a file size sampled from the (median, sigma) log-normal distribution"""
+    median, sigma = distribution
+    size = int(random_state.lognormvariate(0, sigma) * median * size_scale)
+    return max(1, min(size, _MAX_FILE_SIZE))
+
+
+def _source_content(random_state, size):
+    """Returns synthetic source file content of about size bytes with at least one domain"""
+    lines = [random_state.choice(_DOMAIN_LINES)]
+    if random_state.random() < 0.05:
+        lines.append(_NON_ASCII_LINE)
+    length = sum(map(len, lines))
+    while length < size:
+        if random_state.random() < 0.02:
+            line = random_state.choice(_DOMAIN_LINES)
+        else:
+            line = random_state.choice(_SOURCE_LINES)
+        lines.append(line)
+        length += len(line)
+    random_state.shuffle(lines)
+    return ''.join(lines).encode(ENCODING)
+
+
+def _write_file(path, content):
+    """Writes content to path, creating its parent directories"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def _read_list(list_path):
+    """Returns a list of the non-empty lines in list_path"""
+    return list(filter(len, list_path.read_text(encoding=ENCODING).splitlines()))
+
+
+def _generate_contingent_files(tree_path, random_state):
+    """
+    Generates files in CONTINGENT_PATHS, including some that prune_dirs() keeps.
+
+    Returns the number of files generated.
+    """
+    file_count = 0
+    keep_suffixes = sorted(KEEP_SUFFIXES)
+    for cpath in CONTINGENT_PATHS:
+        if not cpath.endswith('/'):
+            _write_file(tree_path / cpath, os.urandom(1024))
+            file_count += 1
+            continue
+        for index in range(_CONTINGENT_FILES):
+            suffix = random_state.choice(keep_suffixes) if index == 0 else '.bin'
+            _write_file(tree_path / cpath / f'dir{index % 3}' / f'file{index}{suffix}',
+                        os.urandom(_sample_size(random_state, _BINARY_SIZE_DISTRIBUTION, 1)))
+            file_count += 1
+    return file_count
+
+
+def generate_tree(tree_path, pruning_sample, domain_substitution_sample, size_scale, random_state):
+    """
+    Generates a synthetic source tree.
+
+    tree_path is a pathlib.Path to the directory to generate. It must not exist.
+    pruning_sample and domain_substitution_sample are lists of the paths to generate
+        binary files and files to domain substitute at.
+    size_scale is a factor applied to all file sizes.
+    random_state is the random.Random to generate the tree with.
+
+    Returns a dictionary of statistics about the tree.
+    """
+    tree_stats = dict.fromkeys(('pruned_files', 'pruned_bytes', 'substituted_files',
+                                'substituted_bytes', 'contingent_files', 'pycache_files'), 0)
+    for relative_path in pruning_sample:
+        size = _sample_size(random_state, _BINARY_SIZE_DISTRIBUTION, size_scale)
+        _write_file(tree_path / relative_path, os.urandom(size))
+        tree_stats['pruned_files'] += 1
+        tree_stats['pruned_bytes'] += size
+    for relative_path in domain_substitution_sample:
+        content = _source_content(random_state,
+                                  _sample_size(random_state, _SOURCE_SIZE_DISTRIBUTION, size_scale))
+        _write_file(tree_path / relative_path, content)
+        tree_stats['substituted_files'] += 1
+        tree_stats['substituted_bytes'] += len(content)
+        if random_state.random() < _PYCACHE_FRACTION:
+            _write_file((tree_path / relative_path).parent / '__pycache__' /
+                        f'{Path(relative_path).stem}.cpython-311.pyc', os.urandom(1024))
+            tree_stats['pycache_files'] += 1
+    tree_stats['contingent_files'] = _generate_contingent_files(tree_path, random_state)
+    return tree_stats
+
+
+def _time_call(function, *args):
+    """Returns the seconds taken to call function with args"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run_benchmark(args):
+    """
+    Runs the benchmark with the options in args, and returns the results as a dictionary.
+    """
+    random_state = random.Random(args.seed)
+    pruning_list = _read_list(args.pruning_list)
+    pruning_sample = sorted(random_state.sample(pruning_list,
+                                                round(len(pruning_list) * args.scale)))
+    domain_substitution_list = _read_list(args.domain_substitution_list)
+    domain_substitution_sample = sorted(
+        random_state.sample(domain_substitution_list,
+                            round(len(domain_substitution_list) * args.scale)))
+    timings = {
+        'apply_substitution': [],
+        'revert_substitution': [],
+        'prune_files': [],
+        'prune_dirs': [],
+    }
+    tree_stats = None
+    for run_index in range(args.repeat):
+        with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmpdirname:
+            tree_path = Path(tmpdirname, 'src')
+            tree_stats = generate_tree(tree_path, pruning_sample, domain_substitution_sample,
+                                       args.size_scale, random.Random(args.seed))
+            files_path = Path(tmpdirname, 'domain_substitution.list')
+            files_path.write_text('\n'.join(domain_substitution_sample), encoding=ENCODING)
+            cache_path = Path(tmpdirname, 'domsubcache.tar')
+            get_logger().info('Run %d of %d', run_index + 1, args.repeat)
+            timings['apply_substitution'].append(
+                _time_call(apply_substitution, args.domain_regex, files_path, tree_path, cache_path,
+                           args.jobs))
+            timings['revert_substitution'].append(
+                _time_call(revert_substitution, cache_path, tree_path, args.jobs))
+            timings['prune_files'].append(
+                _time_call(prune_files, tree_path, pruning_sample, args.jobs))
+            timings['prune_dirs'].append(_time_call(prune_dirs, tree_path, False, None))
+    try:
+        commit = subprocess.run(('git', 'rev-parse', 'HEAD'),
+                                cwd=str(_ROOT_DIR),
+                                capture_output=True,
+                                check=True,
+                                text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {
+            'scale': args.scale,
+            'size_scale': args.size_scale,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'jobs': args.jobs,
+        },
+        'tree': tree_stats,
+        'results': {
+            name: {
+                'min': min(seconds),
+                'median': statistics.median(seconds),
+                'runs': seconds,
+            }
+            for name, seconds in timings.items()
+        },
+    }
+
+
+def main():
+    """CLI entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pruning-list',
+                        type=Path,
+                        default=_ROOT_DIR / 'pruning.list',
+                        help='The pruning.list to generate the tree from. Default: %(default)s')
+    parser.add_argument(
+        '--domain-substitution-list',
+        type=Path,
+        default=_ROOT_DIR / 'domain_substitution.list',
+        help='The domain_substitution.list to generate the tree from. Default: %(default)s')
+    parser.add_argument('--domain-regex',
+                        type=Path,
+                        default=_ROOT_DIR / 'domain_regex.list',
+                        help='The domain_regex.list to substitute with. Default: %(default)s')
+    parser.add_argument('-s',
+                        '--scale',
+                        type=float,
+                        default=0.1,
+                        help=('The fraction of the paths in the lists to generate. '
+                              'Default: %(default)s'))
+    parser.add_argument('--size-scale',
+                        type=float,
+                        default=1.0,
+                        help='The factor to apply to all file sizes. Default: %(default)s')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='The seed to generate the tree with. Default: %(default)s')
+    parser.add_argument('-n',
+                        '--repeat',
+                        type=int,
+                        default=3,
+                        help=('The number of times to generate the tree and run the '
+                              'benchmarks. Default: %(default)s'))
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help=('The number of jobs to pass to the utilities that support it. '
+                              'Default: %(default)s'))
+    parser.add_argument('--tmp-dir',
+                        type=Path,
+                        help='The directory to generate the trees in. Default: the system default')
+    parser.add_argument('-o',
+                        '--output',
+                        type=Path,
+                        help='The JSON file to write the results to. Default: standard output')
+    add_common_params(parser)
+    # The utilities log every file at the INFO level, which would dominate the timings
+    set_logging_level(logging.WARNING)
+    args = parser.parse_args()
+    if not 0 < args.scale <= 1:
+        parser.error('--scale must be greater than 0 and at most 1')
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    results = json.dumps(run_benchmark(args), indent=2)
+    if args.output:
+        args.output.write_text(results + '\n', encoding=ENCODING)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,14 +21,17 @@ from pathlib import Path, PurePosixPath
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utils'))
 from _common import get_logger
-from domain_substitution import DomainRegexList, TREE_ENCODINGS
-from prune_binaries import CONTINGENT_PATHS
+from domain_substitution import DomainRegexList, TREE_ENCODINGS, may_match
+from prune_binaries import PruningMatcher
 
 sys.path.pop(0)
 
 # Encoding for output files
 _ENCODING = 'UTF-8'
 
+# Matcher for CONTINGENT_PATHS
+_PRUNING_MATCHER = PruningMatcher()
+
 # pylint: disable=line-too-long
 
 # NOTE: Include patterns have precedence over exclude patterns
@@ -212,14 +215,18 @@ def should_prune(path, relative_path, used_pep_set, used_pip_set):
     return False
 
 
-def _check_regex_match(file_path, search_regex):
+def _check_regex_match(file_path, search_regex, search_literals=None):
     """
     Returns True if a regex pattern matches a file; False otherwise
 
     file_path is a pathlib.Path to the file to test
     search_regex is a compiled regex object to search for domain names
+    search_literals is a tuple of byte strings like from DomainRegexList.search_literals
+        Files containing none of them are rejected without reading them into memory.
     """
     with file_path.open("rb") as file_obj:
+        if not may_match(file_obj, search_literals):
+            return False
         file_bytes = file_obj.read()
         content = None
         for encoding in TREE_ENCODINGS:
@@ -233,12 +240,19 @@ def _check_regex_match(file_path, search_regex):
     return False
 
 
-def should_domain_substitute(path, relative_path, search_regex, used_dep_set, used_dip_set):
+def should_domain_substitute( #pylint: disable=too-many-arguments
+        path,
+        relative_path,
+        search_regex,
+        used_dep_set,
+        used_dip_set,
+        search_literals=None):
     """
     Returns True if a path should be domain substituted in the source tree; False otherwise
 
     path is the pathlib.Path to the file from the current working directory.
     relative_path is the pathlib.Path to the file from the source tree.
+    search_literals is like in _check_regex_match()
     used_dep_set is a list of DOMAIN_EXCLUDE_PREFIXES that have been matched
     used_dip_set is a list of DOMAIN_INCLUDE_PATTERNS that have been matched
     """
@@ -254,17 +268,18 @@ def should_domain_substitute(path, relative_path, search_regex, used_dep_set, us
             for license_path in ['license', 'license.txt', 'license.html']:
                 if relative_path_posix.endswith('/' + license_path):
                     return False
-            return _check_regex_match(path, search_regex)
+            return _check_regex_match(path, search_regex, search_literals)
     return False
 
 
-def compute_lists_proc(path, source_tree, search_regex):
+def compute_lists_proc(path, source_tree, search_regex, search_literals=None):
     """
     Adds the path to appropriate lists to be used by compute_lists.
 
     path is the pathlib.Path to the file from the current working directory.
     source_tree is a pathlib.Path to the source tree
     search_regex is a compiled regex object to search for domain names
+    search_literals is like in _check_regex_match()
     """
     used_pep_set = set() # PRUNING_EXCLUDE_PATTERNS
     used_pip_set = set() # PRUNING_INCLUDE_PATTERNS
@@ -275,7 +290,7 @@ def compute_lists_proc(path, source_tree, search_regex):
     symlink_set = set()
     if path.is_file():
         relative_path = path.relative_to(source_tree)
-        if not any(str(relative_path.as_posix()).startswith(cpath) for cpath in CONTINGENT_PATHS):
+        if not _PRUNING_MATCHER.is_contingent(relative_path.as_posix()):
             if path.is_symlink():
                 try:
                     resolved_relative_posix = path.resolve().relative_to(source_tree).as_posix()
@@ -288,7 +303,7 @@ def compute_lists_proc(path, source_tree, search_regex):
                     if should_prune(path, relative_path, used_pep_set, used_pip_set):
                         pruning_set.add(relative_path.as_posix())
                     elif should_domain_substitute(path, relative_path, search_regex, used_dep_set,
-                                                  used_dip_set):
+                                                  used_dip_set, search_literals):
                         domain_substitution_set.add(relative_path.as_posix())
                 except: #pylint: disable=bare-except
                     get_logger().exception('Unhandled exception while processing %s', relative_path)
@@ -296,7 +311,7 @@ def compute_lists_proc(path, source_tree, search_regex):
             domain_substitution_set, symlink_set)
 
 
-def compute_lists(source_tree, search_regex, processes): # pylint: disable=too-many-locals
+def compute_lists(source_tree, search_regex, processes, search_literals=None): # pylint: disable=too-many-locals
     """
     Compute the binary pruning and domain substitution lists of the source tree.
     Returns a tuple of three items in the following order:
@@ -307,6 +322,7 @@ def compute_lists(source_tree, search_regex, processes): # pylint: disable=too-m
     source_tree is a pathlib.Path to the source tree
     search_regex is a compiled regex object to search for domain names
     processes is the maximum number of worker processes to create
+    search_literals is like in _check_regex_match()
     """
     pruning_set = set()
     domain_substitution_set = set()
@@ -318,7 +334,8 @@ def compute_lists(source_tree, search_regex, processes): # pylint: disable=too-m
     with multiprocessing.Pool(processes) as procpool:
         returned_data = procpool.starmap(
             compute_lists_proc,
-            zip(source_tree.rglob('*'), repeat(source_tree), repeat(search_regex)))
+            zip(source_tree.rglob('*'), repeat(source_tree), repeat(search_regex),
+                repeat(search_literals)))
 
     # Handle the returned data
     for (used_pep_set, used_pip_set, used_dep_set, used_dip_set, returned_pruning_set,
@@ -390,9 +407,10 @@ def main(args_list=None):
         get_logger().error('No source tree found. Aborting.')
         sys.exit(1)
     get_logger().info('Computing lists...')
+    domain_regex_list = DomainRegexList(args.domain_regex)
     pruning_set, domain_substitution_set, unused_patterns = compute_lists(
-        args.tree,
-        DomainRegexList(args.domain_regex).search_regex, args.processes)
+        args.tree, domain_regex_list.search_regex, args.processes,
+        domain_regex_list.search_literals)
     with args.pruning.open('w', encoding=_ENCODING) as file_obj:
         file_obj.writelines(f'{line}\n' for line in pruning_set)
     with args.domain_substitution.open('w', encoding=_ENCODING) as file_obj:
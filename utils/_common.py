@@ -5,11 +5,20 @@
 # found in the LICENSE file.
 """Common code and constants"""
 import argparse
+import contextlib
 import enum
 import logging
+import os
 import platform
+import shutil
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
 # Constants
 
 ENCODING = 'UTF-8' # For config files and patches
@@ -18,6 +27,9 @@ USE_REGISTRY = '_use_registry'
 
 LOGGER_NAME = 'ungoogled'
 
+# ioctl request of Linux to clone the extents of a file (reflink)
+_FICLONE = 0x40049409
+
 # Public classes
 
 
@@ -34,6 +46,13 @@ class ExtractorEnum: #pylint: disable=too-few-public-methods
     WINRAR = 'winrar'
 
 
+class LinkModeEnum(enum.Enum):
+    """Enum for the ways to create a file with the content of another file"""
+    HARDLINK = 'hardlink'
+    REFLINK = 'reflink'
+    COPY = 'copy'
+
+
 class SetLogLevel(argparse.Action): #pylint: disable=too-few-public-methods
     """Sets logging level based on command line arguments it receives"""
 
@@ -132,6 +151,73 @@ def parse_series(series_path):
     return series_lines
 
 
+def _reflink_file(source, destination):
+    """
+    Creates destination as a copy-on-write clone of source.
+
+    Raises OSError if the filesystem or platform does not support it.
+    """
+    if fcntl is None:
+        raise OSError('Reflinks are not supported on this platform')
+    with source.open('rb') as source_file, destination.open('xb') as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), _FICLONE, source_file.fileno())
+        except OSError:
+            destination_file.close()
+            destination.unlink()
+            raise
+    shutil.copystat(str(source), str(destination))
+
+
+def link_file(source, destination, link_modes=tuple(LinkModeEnum)):
+    """
+    Creates destination with the content of source, with the first of link_modes that
+    succeeds. Hard links and reflinks avoid copying the content.
+
+    source and destination are pathlib.Path. destination must not exist.
+    link_modes is an iterable of LinkModeEnum to try in order.
+
+    Returns the LinkModeEnum that was used.
+    Raises the OSError of the last link mode if none succeeded.
+    """
+    error = None
+    for link_mode in link_modes:
+        try:
+            if link_mode == LinkModeEnum.HARDLINK:
+                os.link(str(source), str(destination))
+            elif link_mode == LinkModeEnum.REFLINK:
+                _reflink_file(source, destination)
+            elif link_mode == LinkModeEnum.COPY:
+                shutil.copy2(str(source), str(destination))
+            else:
+                raise ValueError(f'Unknown link mode: {link_mode}')
+            return link_mode
+        except (FileExistsError, FileNotFoundError):
+            raise
+        except OSError as exc:
+            error = exc
+    raise error
+
+
+@contextlib.contextmanager
+def lock_file(lock_path):
+    """
+    Context manager that holds an exclusive lock on lock_path, which is shared by
+    concurrent processes. lock_path is created if needed.
+
+    Without file locking, like on Windows, nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+    with lock_path.open('a') as lock_file_obj:
+        fcntl.flock(lock_file_obj.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file_obj.fileno(), fcntl.LOCK_UN)
+
+
 def add_common_params(parser):
     """
     Adds common command line arguments to a parser.
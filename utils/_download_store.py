@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""
+Content-addressed store of verified downloads shared by download caches
+"""
+
+import os
+import threading
+
+from _common import get_logger, link_file, lock_file
+
+
+class DownloadStore:
+    """
+    Directory of verified downloads keyed by their expected hashes, which can be shared by
+    the download caches of concurrent builds and different versions.
+
+    Downloads are materialized into download caches with hard links or reflinks if possible,
+    so that all caches share a single copy of each download. The least recently used
+    downloads are evicted when the store is larger than its maximum size.
+    """
+
+    def __init__(self, store_dir, max_size=None):
+        """
+        store_dir is a pathlib.Path to the store directory. It is created if needed.
+        max_size is the maximum size of the store in bytes, or None for no limit.
+        """
+        self._objects_dir = store_dir / 'objects'
+        self._used_dir = store_dir / 'used'
+        self._lock_path = store_dir / '.lock'
+        self._max_size = max_size
+        self._objects_dir.mkdir(parents=True, exist_ok=True)
+        self._used_dir.mkdir(parents=True, exist_ok=True)
+
+    def _tmp_path(self, directory, key):
+        """Returns a temporary path in directory that is unique to this process and thread"""
+        return directory / f'.{key}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def _mark_used(self, key):
+        """Records the use of key for evicting the least recently used downloads"""
+        (self._used_dir / key).touch()
+
+    def materialize(self, key, destination):
+        """
+        Creates destination from the download with key in the store.
+
+        destination is a pathlib.Path to the file to create. It is replaced if it exists.
+
+        Returns True if the download was in the store; False otherwise.
+        """
+        tmp_path = self._tmp_path(destination.parent, key)
+        try:
+            link_mode = link_file(self._objects_dir / key, tmp_path)
+        except FileNotFoundError:
+            return False
+        os.replace(tmp_path, destination)
+        self._mark_used(key)
+        get_logger().info('Using %s from the download store (%s)', destination.name,
+                          link_mode.value)
+        return True
+
+    def add(self, key, source):
+        """
+        Adds the verified download at source to the store with key, and evicts the least
+        recently used downloads if the store is larger than its maximum size.
+
+        source is a pathlib.Path to the download.
+        """
+        object_path = self._objects_dir / key
+        if not object_path.exists():
+            tmp_path = self._tmp_path(self._objects_dir, key)
+            link_file(source, tmp_path)
+            os.replace(tmp_path, object_path)
+            get_logger().debug('Added %s to the download store', source.name)
+        self._mark_used(key)
+        self.evict()
+
+    def remove(self, key):
+        """Removes the download with key from the store, like if it is corrupt"""
+        for path in (self._objects_dir / key, self._used_dir / key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """Deletes the least recently used downloads until the store fits its maximum size"""
+        if self._max_size is None:
+            return
+        # Concurrent evictions would size the store from the same listing and evict too much
+        with lock_file(self._lock_path):
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """Like evict(), but the caller must hold the lock of the store"""
+        entries = []
+        total_size = 0
+        for object_path in self._objects_dir.iterdir():
+            if object_path.name.startswith('.'):
+                continue
+            try:
+                size = object_path.stat().st_size
+            except FileNotFoundError:
+                # Evicted concurrently
+                continue
+            try:
+                last_used = (self._used_dir / object_path.name).stat().st_mtime_ns
+            except FileNotFoundError:
+                last_used = 0
+            entries.append((last_used, object_path.name, size))
+            total_size += size
+        entries.sort()
+        for _, key, size in entries:
+            if total_size <= self._max_size:
+                break
+            get_logger().info('Evicting %s from the download store', key)
+            self.remove(key)
+            total_size -= size
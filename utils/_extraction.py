@@ -7,13 +7,26 @@
 Archive extraction utilities
 """
 
+import bz2
+import concurrent.futures
+import contextlib
+import errno
+import functools
+import gzip
+import io
+import lzma
 import os
+import queue
 import shutil
 import subprocess
 import tarfile
+import tempfile
+import threading
 from pathlib import Path, PurePosixPath
 
-from _common import (USE_REGISTRY, PlatformEnum, ExtractorEnum, get_logger, get_running_platform)
+from _common import (ENCODING, USE_REGISTRY, PlatformEnum, ExtractorEnum, get_logger,
+                     get_running_platform)
+from prune_binaries import prune_files
 
 DEFAULT_EXTRACTORS = {
     ExtractorEnum.SEVENZIP: USE_REGISTRY,
@@ -21,6 +34,31 @@ DEFAULT_EXTRACTORS = {
     ExtractorEnum.WINRAR: USE_REGISTRY,
 }
 
+# Multi-threaded decompressor commands by archive suffix, in order of preference.
+# They read the archive from stdin and write the tar stream to stdout.
+_PARALLEL_DECOMPRESSORS = {
+    '.xz': (('pixz', '-d'), ('xz', '-d', '-c', '-T0')),
+    '.gz': (('pigz', '-d', '-c'), ),
+    '.bz2': (('lbzip2', '-d', '-c'), ('pbzip2', '-d', '-c')),
+}
+
+# Python decompressors by archive suffix for the threaded fallback
+_PYTHON_DECOMPRESSORS = {
+    '.xz': lzma.open,
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+}
+
+# Size of the decompressed chunks, and the number of chunks buffered between
+# the decompression thread and the extractor
+_DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+_DECOMPRESS_QUEUE_CHUNKS = 16
+
+# Number of files and bytes per writer thread that are read from the tar stream but not yet
+# written. Larger files are written while they are read, without holding them in memory.
+_WRITER_PENDING_FILES = 8
+_WRITER_PENDING_BYTES = 8 * 1024 * 1024
+
 
 def _find_7z_by_registry():
     """
@@ -69,7 +107,7 @@ def _find_extractor_by_cmd(extractor_cmd):
 
 def _process_relative_to(unpack_root, relative_to):
     """
-    For an extractor that doesn't support an automatic transform, move the extracted
+    For an extractor that can't strip leading directories while unpacking, move the extracted
     contents from the relative_to/ directory to the unpack_root
 
     If relative_to is None, nothing is done.
@@ -87,7 +125,147 @@ def _process_relative_to(unpack_root, relative_to):
     relative_root.rmdir()
 
 
-def _extract_tar_with_7z(binary, archive_path, output_dir, relative_to):
+def _find_parallel_decompressor(archive_path):
+    """
+    Returns the command of a multi-threaded decompressor for the archive,
+    or None if none was found.
+    """
+    for cmd in _PARALLEL_DECOMPRESSORS.get(archive_path.suffix, ()):
+        binary = shutil.which(cmd[0])
+        if binary is not None:
+            return (binary, *cmd[1:])
+    return None
+
+
+class _ThreadedDecompressor(io.RawIOBase):
+    """
+    Read-only stream of a compressed file that is decompressed by a separate thread,
+    so that decompression overlaps with extraction.
+    """
+
+    def __init__(self, archive_path, open_func):
+        super().__init__()
+        self._queue = queue.Queue(_DECOMPRESS_QUEUE_CHUNKS)
+        self._stopped = threading.Event()
+        self._chunk = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress,
+                                        args=(archive_path, open_func),
+                                        daemon=True)
+        self._thread.start()
+
+    def _decompress(self, archive_path, open_func):
+        """Decompresses chunks into the queue, ending with an empty chunk or an exception"""
+        try:
+            with open_func(str(archive_path), 'rb') as compressed_file:
+                while not self._stopped.is_set():
+                    chunk = compressed_file.read(_DECOMPRESS_CHUNK_BYTES)
+                    self._queue.put(chunk)
+                    if not chunk:
+                        break
+        except BaseException as exc: #pylint: disable=broad-except
+            self._queue.put(exc)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._eof:
+            chunk = self._queue.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self._eof = not chunk
+            self._chunk = memoryview(chunk)
+        length = min(len(buffer), len(self._chunk))
+        buffer[:length] = self._chunk[:length]
+        self._chunk = self._chunk[length:]
+        return length
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            # Unblock the decompression thread if the queue is full
+            while self._thread.is_alive():
+                with contextlib.suppress(queue.Empty):
+                    self._queue.get_nowait()
+                self._thread.join(0.01)
+        super().close()
+
+
+@contextlib.contextmanager
+def _open_decompressed(archive_path):
+    """
+    Context manager that yields a binary stream of the decompressed tar archive.
+
+    A multi-threaded decompressor is used if one is found for the archive. Otherwise, the
+    archive is decompressed by a separate thread. Uncompressed archives are read directly.
+
+    Raises ChildProcessError if the multi-threaded decompressor fails.
+    """
+    if archive_path.suffix not in _PYTHON_DECOMPRESSORS:
+        with archive_path.open('rb') as archive_file:
+            yield archive_file
+        return
+    cmd = _find_parallel_decompressor(archive_path)
+    if cmd is None:
+        get_logger().debug('Decompressing with a separate thread')
+        with io.BufferedReader(_ThreadedDecompressor(archive_path,
+                                                     _PYTHON_DECOMPRESSORS[archive_path.suffix]),
+                               buffer_size=_DECOMPRESS_CHUNK_BYTES) as decompressed_file:
+            yield decompressed_file
+        return
+    get_logger().debug('Decompressing with: %s', ' '.join(cmd))
+    with archive_path.open('rb') as archive_file, subprocess.Popen(cmd,
+                                                                   stdin=archive_file,
+                                                                   stdout=subprocess.PIPE) as proc:
+        try:
+            yield proc.stdout
+        except BaseException:
+            proc.kill()
+            raise
+    if proc.returncode != 0:
+        get_logger().error('Decompressor command returned %s', proc.returncode)
+        raise ChildProcessError()
+
+
+def _prune_skipped(output_dir, skip_paths):
+    """
+    For an extractor that can't skip archive members, delete the extracted files
+    in skip_paths from output_dir.
+
+    If skip_paths is None, nothing is done.
+    """
+    if skip_paths is None:
+        return
+    prune_files(output_dir, skip_paths)
+
+
+def _is_gnu_tar(binary):
+    """Returns True if the tar binary is GNU tar; False otherwise"""
+    result = subprocess.run((binary, '--version'),
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            check=False,
+                            universal_newlines=True)
+    return result.returncode == 0 and 'GNU tar' in result.stdout
+
+
+def _tar_member_prefix(archive_path):
+    """
+    Returns './' if the names of the members in the tar archive start with it, or '' otherwise.
+    Only the first member header is read.
+    """
+    try:
+        with tarfile.open(str(archive_path), 'r|*') as tar_file_obj:
+            tarinfo = tar_file_obj.next()
+    except tarfile.TarError:
+        return ''
+    if tarinfo is not None and (tarinfo.name == '.' or tarinfo.name.startswith('./')):
+        return './'
+    return ''
+
+
+def _extract_tar_with_7z(binary, archive_path, output_dir, relative_to, skip_paths=None):
     get_logger().debug('Using 7-zip extractor')
     if not relative_to is None and (output_dir / relative_to).exists():
         get_logger().error('Temporary unpacking directory already exists: %s',
@@ -108,24 +286,51 @@ def _extract_tar_with_7z(binary, archive_path, output_dir, relative_to):
         raise ChildProcessError()
 
     _process_relative_to(output_dir, relative_to)
+    _prune_skipped(output_dir, skip_paths)
 
 
-def _extract_tar_with_tar(binary, archive_path, output_dir, relative_to):
+def _extract_tar_with_tar(binary, archive_path, output_dir, relative_to, skip_paths=None):
     get_logger().debug('Using BSD or GNU tar extractor')
     output_dir.mkdir(exist_ok=True)
-    cmd = (binary, '-xf', str(archive_path), '-C', str(output_dir))
-    get_logger().debug('tar command line: %s', ' '.join(cmd))
-    result = subprocess.run(cmd, check=False)
+    decompressor_cmd = _find_parallel_decompressor(archive_path)
+    if decompressor_cmd is None:
+        cmd = (binary, '-xf', str(archive_path), '-C', str(output_dir))
+    else:
+        cmd = (binary, '-xf', '-', '-C', str(output_dir))
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.ExitStack() as exit_stack:
+        # Member names are matched as stored, and tar counts the leading '.' as a component
+        member_prefix = _tar_member_prefix(archive_path)
+        if skip_paths is not None and _is_gnu_tar(binary):
+            # Only GNU tar can match exclusions literally, so BSD tar prunes afterwards
+            exclude_path = Path(tmp_dir, 'exclude.list')
+            prefix = member_prefix
+            if relative_to is not None:
+                prefix += f'{PurePosixPath(relative_to)}/'
+            exclude_path.write_text(''.join(f'{prefix}{path}\n' for path in skip_paths),
+                                    encoding=ENCODING)
+            cmd += ('--anchored', '--no-wildcards', f'--exclude-from={exclude_path}')
+            skip_paths = None
+        if relative_to is not None:
+            # Both GNU and BSD tar strip the leading directories while unpacking. Only the
+            # members under relative_to are unpacked, and tar fails if there are none.
+            strip_count = len(PurePosixPath(relative_to).parts) + bool(member_prefix)
+            cmd += (f'--strip-components={strip_count}',
+                    f'{member_prefix}{PurePosixPath(relative_to)}')
+        if decompressor_cmd is None:
+            get_logger().debug('tar command line: %s', ' '.join(cmd))
+            result = subprocess.run(cmd, check=False)
+        else:
+            decompressed_file = exit_stack.enter_context(_open_decompressed(archive_path))
+            get_logger().debug('tar command line: %s', ' '.join(cmd))
+            result = subprocess.run(cmd, stdin=decompressed_file, check=False)
     if result.returncode != 0:
         get_logger().error('tar command returned %s', result.returncode)
         raise ChildProcessError()
 
-    # for gnu tar, the --transform option could be used. but to keep compatibility with
-    # bsdtar on macos, we just do this ourselves
-    _process_relative_to(output_dir, relative_to)
+    _prune_skipped(output_dir, skip_paths)
 
 
-def _extract_tar_with_winrar(binary, archive_path, output_dir, relative_to):
+def _extract_tar_with_winrar(binary, archive_path, output_dir, relative_to, skip_paths=None):
     get_logger().debug('Using WinRAR extractor')
     output_dir.mkdir(exist_ok=True)
     cmd = (binary, 'x', '-o+', str(archive_path), str(output_dir))
@@ -136,24 +341,166 @@ def _extract_tar_with_winrar(binary, archive_path, output_dir, relative_to):
         raise ChildProcessError()
 
     _process_relative_to(output_dir, relative_to)
+    _prune_skipped(output_dir, skip_paths)
 
 
-def _extract_tar_with_python(archive_path, output_dir, relative_to):
-    get_logger().debug('Using pure Python tar extractor')
+class _ConcurrentMemberWriter: #pylint: disable=too-many-instance-attributes
+    """
+    Writes the regular files read from a tar stream with a pool of threads, so that file
+    creation latency overlaps with reading the stream.
 
-    class NoAppendList(list):
-        """Hack to workaround memory issues with large tar files"""
+    Directories are created once and cached. Before a member is extracted at a path, or
+    as a link to a path, the queued file at that path is written, so the result is the same
+    as when extracting the members in order.
+    """
 
-        def append(self, obj):
-            pass
+    def __init__(self, tar_file_obj, output_dir, writers):
+        self._tar_file_obj = tar_file_obj
+        self._created_dirs = {output_dir}
+        self._executor = concurrent.futures.ThreadPoolExecutor(writers)
+        self._max_pending_files = writers * _WRITER_PENDING_FILES
+        self._max_pending_bytes = writers * _WRITER_PENDING_BYTES
+        # Guards the following attributes, which are updated as files are written
+        self._pending_changed = threading.Condition()
+        self._pending_bytes = 0
+        self._pending_writes = {}
+        self._errors = []
+
+    def make_dirs(self, directory):
+        """Creates directory and its parents if they were not created already"""
+        if directory in self._created_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        while directory not in self._created_dirs:
+            self._created_dirs.add(directory)
+            directory = directory.parent
+
+    def _write_file(self, tarinfo, destination, content):
+        """Writes the file like _write_member_file()"""
+        _write_member_file(self._tar_file_obj, tarinfo, destination, content)
+
+    def _file_written(self, destination, size, future):
+        with self._pending_changed:
+            self._pending_bytes -= size
+            if self._pending_writes.get(destination) is future:
+                del self._pending_writes[destination]
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+            self._pending_changed.notify_all()
+
+    def _can_queue(self, size):
+        """Returns True if a file of size bytes can be queued without exceeding the limits"""
+        if self._errors or not self._pending_writes:
+            return True
+        return (len(self._pending_writes) < self._max_pending_files
+                and self._pending_bytes + size <= self._max_pending_bytes)
+
+    def can_queue_size(self, size):
+        """Returns True if a file of size bytes is small enough to be held until it is written"""
+        return size <= self._max_pending_bytes
+
+    def wait_for(self, *paths):
+        """Waits for the queued files at paths to be written. paths may contain None."""
+        with self._pending_changed:
+            futures = [self._pending_writes.get(path) for path in paths if path is not None]
+        concurrent.futures.wait([future for future in futures if future is not None])
+
+    def write_file(self, tarinfo, destination, content):
+        """
+        Queues the regular file tarinfo with content to be written to destination.
+
+        Raises the exception of a previously queued file that could not be written.
+        """
+        self.make_dirs(destination.parent)
+        self.wait_for(destination)
+        with self._pending_changed:
+            self._pending_changed.wait_for(functools.partial(self._can_queue, len(content)))
+            if self._errors:
+                raise self._errors[0]
+            self._pending_bytes += len(content)
+            future = self._executor.submit(self._write_file, tarinfo, destination, content)
+            self._pending_writes[destination] = future
+        future.add_done_callback(functools.partial(self._file_written, destination, len(content)))
+
+    def stream_file(self, tarinfo, destination, member_file):
+        """
+        Writes the regular file tarinfo from member_file to destination on the calling thread
+        once the queued file at destination is written.
+        """
+        self.make_dirs(destination.parent)
+        self.wait_for(destination)
+        self._write_file(tarinfo, destination, member_file)
+
+    def close(self):
+        """
+        Waits for the queued files to be written.
+
+        Raises the exception of the first file that could not be written.
+        """
+        self._executor.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+
+
+def _write_member_file(tar_file_obj, tarinfo, destination, content):
+    """
+    Writes the regular file tarinfo from tar_file_obj to destination, and sets its owner,
+    mode and modification time from the archive like TarFile extraction does.
 
+    content is the bytes of the file, or a file object to copy them from.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    if hasattr(os, 'O_NOFOLLOW'):
+        try:
+            file_fd = os.open(destination, flags | os.O_NOFOLLOW, 0o666)
+        except OSError as exc:
+            if exc.errno != errno.ELOOP:
+                raise
+            # Replace the symlink instead of writing through it
+            destination.unlink()
+            file_fd = os.open(destination, flags, 0o666)
+    else:
+        if destination.is_symlink():
+            destination.unlink()
+        file_fd = os.open(destination, flags, 0o666)
+    with open(file_fd, 'wb') as file_obj:
+        if isinstance(content, bytes):
+            file_obj.write(content)
+        else:
+            shutil.copyfileobj(content, file_obj)
+    tar_file_obj.chown(tarinfo, str(destination), False)
+    tar_file_obj.chmod(tarinfo, str(destination))
+    tar_file_obj.utime(tarinfo, str(destination))
+
+
+def _write_rewritten_member(tar_file_obj, tarinfo, destination, rewrite_func):
+    """
+    Writes the regular file tarinfo from tar_file_obj to destination with its content
+    rewritten by rewrite_func, like _write_member_file().
+    """
+    with tar_file_obj.extractfile(tarinfo) as member_file:
+        content = rewrite_func(member_file.read())
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    _write_member_file(tar_file_obj, tarinfo, destination, content)
+
+
+def _symlinks_supported():
+    """Returns True if symlinks are probably supported by the system"""
     # Simple hack to check if symlinks are supported
-    symlink_supported = False
     try:
         os.symlink('', '')
     except FileNotFoundError:
         # Symlinks probably supported
-        symlink_supported = True
+        return True
     except OSError:
         # Symlinks probably not supported
         get_logger().info('System does not support symlinks. Ignoring them.')
@@ -161,15 +508,84 @@ def _extract_tar_with_python(archive_path, output_dir, relative_to):
         # Unexpected exception
         get_logger().exception('Unexpected exception during symlink support check.')
         raise
+    return False
+
+
+def _rewrite_func(rewrite_paths, relative_path):
+    """
+    Returns a function that takes the content of the file at relative_path and returns the
+    content to write instead, or None if the file is not rewritten.
+    """
+    if rewrite_paths is None:
+        return None
+    return rewrite_paths.get(relative_path.as_posix())
+
+
+def _link_target(tarinfo, destination):
+    """Returns the path that the link tarinfo at destination points to, or None"""
+    if tarinfo.islnk():
+        return Path(tarinfo._link_target) # pylint: disable=protected-access
+    if tarinfo.issym():
+        return Path(os.path.normpath(destination.parent / tarinfo.linkname))
+    return None
+
+
+def _queue_member(tar_file_obj, tarinfo, destination, writer, rewrite_func):
+    """
+    Reads the regular file tarinfo from tar_file_obj, rewrites its content with
+    rewrite_func if it is not None, and queues it to be written by writer.
+    """
+    with tar_file_obj.extractfile(tarinfo) as member_file:
+        if rewrite_func is None and not writer.can_queue_size(tarinfo.size):
+            writer.stream_file(tarinfo, destination, member_file)
+            return
+        content = member_file.read()
+    if rewrite_func is not None:
+        content = rewrite_func(content)
+    writer.write_file(tarinfo, destination, content)
+
+
+def _extract_tar_with_python( #pylint: disable=too-many-arguments
+        archive_path,
+        output_dir,
+        relative_to,
+        skip_paths=None,
+        rewrite_paths=None,
+        writers=1):
+    get_logger().debug('Using pure Python tar extractor')
 
-    with tarfile.open(str(archive_path), f'r|{archive_path.suffix[1:]}') as tar_file_obj:
+    class NoAppendList(list):
+        """Hack to workaround memory issues with large tar files"""
+
+        def append(self, obj):
+            pass
+
+    symlink_supported = _symlinks_supported()
+    if writers > 1:
+        get_logger().debug('Writing files with %s threads', writers)
+    with _open_decompressed(archive_path) as decompressed_file, \
+            tarfile.open(fileobj=decompressed_file, mode='r|') as tar_file_obj, \
+            (_ConcurrentMemberWriter(tar_file_obj, output_dir, writers)
+             if writers > 1 else contextlib.nullcontext()) as writer:
         tar_file_obj.members = NoAppendList()
         for tarinfo in tar_file_obj:
             try:
                 if relative_to is None:
-                    destination = output_dir / PurePosixPath(tarinfo.name)
+                    relative_path = PurePosixPath(tarinfo.name)
                 else:
-                    destination = output_dir / PurePosixPath(tarinfo.name).relative_to(relative_to)
+                    relative_path = PurePosixPath(tarinfo.name).relative_to(relative_to)
+                if skip_paths is not None and relative_path.as_posix() in skip_paths:
+                    continue
+                destination = output_dir / relative_path
+                if writer is not None and tarinfo.isreg():
+                    _queue_member(tar_file_obj, tarinfo, destination, writer,
+                                  _rewrite_func(rewrite_paths, relative_path))
+                    continue
+                if rewrite_paths is not None and tarinfo.isreg() and relative_path.as_posix(
+                ) in rewrite_paths:
+                    _write_rewritten_member(tar_file_obj, tarinfo, destination,
+                                            rewrite_paths[relative_path.as_posix()])
+                    continue
                 if tarinfo.issym() and not symlink_supported:
                     # In this situation, TarFile.makelink() will try to create a copy of the
                     # target. But this fails because TarFile.members is empty
@@ -181,6 +597,9 @@ def _extract_tar_with_python(archive_path, output_dir, relative_to):
                     new_target = output_dir / PurePosixPath(
                         tarinfo.linkname).relative_to(relative_to)
                     tarinfo._link_target = new_target.as_posix() # pylint: disable=protected-access
+                if writer is not None:
+                    writer.make_dirs(destination.parent)
+                    writer.wait_for(destination, _link_target(tarinfo, destination))
                 if destination.is_symlink():
                     destination.unlink()
                 tar_file_obj._extract_member(tarinfo, str(destination)) # pylint: disable=protected-access
@@ -189,7 +608,14 @@ def _extract_tar_with_python(archive_path, output_dir, relative_to):
                 raise
 
 
-def extract_tar_file(archive_path, output_dir, relative_to, extractors=None):
+def extract_tar_file( #pylint: disable=too-many-arguments
+        archive_path,
+        output_dir,
+        relative_to,
+        extractors=None,
+        skip_paths=None,
+        rewrite_paths=None,
+        writers=1):
     """
     Extract regular or compressed tar archive into the output directory.
 
@@ -200,9 +626,22 @@ def extract_tar_file(archive_path, output_dir, relative_to, extractors=None):
         root of the archive, or None if no path components should be stripped.
     extractors is a dictionary of PlatformEnum to a command or path to the
         extractor binary. Defaults to 'tar' for tar, and '_use_registry' for 7-Zip and WinRAR.
+    skip_paths is a set of POSIX paths of files relative to output_dir that should not be
+        unpacked, or None to unpack all files. The Python extractor and GNU tar skip them
+        while unpacking; other extractors delete them afterwards.
+    rewrite_paths is a mapping of POSIX paths of files relative to output_dir to functions
+        that take the raw content of the file and return the content to write instead.
+        Only the Python extractor can rewrite files, so it is always used if rewrite_paths
+        is not None.
+    writers is the number of threads that write the unpacked files. If it is greater than 1,
+        the Python extractor is always used, and it writes files while reading the archive.
     """
     if extractors is None:
         extractors = DEFAULT_EXTRACTORS
+    if rewrite_paths is not None or writers > 1:
+        _extract_tar_with_python(archive_path, output_dir, relative_to, skip_paths, rewrite_paths,
+                                 writers)
+        return
 
     current_platform = get_running_platform()
     if current_platform == PlatformEnum.WINDOWS:
@@ -212,7 +651,7 @@ def extract_tar_file(archive_path, output_dir, relative_to, extractors=None):
             sevenzip_cmd = str(_find_7z_by_registry())
         sevenzip_bin = _find_extractor_by_cmd(sevenzip_cmd)
         if sevenzip_bin is not None:
-            _extract_tar_with_7z(sevenzip_bin, archive_path, output_dir, relative_to)
+            _extract_tar_with_7z(sevenzip_bin, archive_path, output_dir, relative_to, skip_paths)
             return
 
         # Use WinRAR if 7-zip is not found
@@ -221,7 +660,7 @@ def extract_tar_file(archive_path, output_dir, relative_to, extractors=None):
             winrar_cmd = str(_find_winrar_by_registry())
         winrar_bin = _find_extractor_by_cmd(winrar_cmd)
         if winrar_bin is not None:
-            _extract_tar_with_winrar(winrar_bin, archive_path, output_dir, relative_to)
+            _extract_tar_with_winrar(winrar_bin, archive_path, output_dir, relative_to, skip_paths)
             return
         get_logger().warning(
             'Neither 7-zip nor WinRAR were found. Falling back to Python extractor...')
@@ -229,16 +668,16 @@ def extract_tar_file(archive_path, output_dir, relative_to, extractors=None):
         # NOTE: 7-zip isn't an option because it doesn't preserve file permissions
         tar_bin = _find_extractor_by_cmd(extractors.get(ExtractorEnum.TAR))
         if not tar_bin is None:
-            _extract_tar_with_tar(tar_bin, archive_path, output_dir, relative_to)
+            _extract_tar_with_tar(tar_bin, archive_path, output_dir, relative_to, skip_paths)
             return
     else:
         # This is not a normal code path, so make it clear.
         raise NotImplementedError(current_platform)
     # Fallback to Python-based extractor on all platforms
-    _extract_tar_with_python(archive_path, output_dir, relative_to)
+    _extract_tar_with_python(archive_path, output_dir, relative_to, skip_paths)
 
 
-def extract_with_7z(archive_path, output_dir, relative_to, extractors=None):
+def extract_with_7z(archive_path, output_dir, relative_to, extractors=None, skip_paths=None):
     """
     Extract archives with 7-zip into the output directory.
     Only supports archives with one layer of unpacking, so compressed tar archives don't work.
@@ -250,6 +689,8 @@ def extract_with_7z(archive_path, output_dir, relative_to, extractors=None):
     root of the archive.
     extractors is a dictionary of PlatformEnum to a command or path to the
     extractor binary. Defaults to 'tar' for tar, and '_use_registry' for 7-Zip.
+    skip_paths is a set of POSIX paths of files relative to output_dir that are deleted
+    after unpacking, or None.
     """
     # TODO: It would be nice to extend this to support arbitrary standard IO chaining of 7z
     # instances, so _extract_tar_with_7z and other future formats could use this.
@@ -276,9 +717,10 @@ def extract_with_7z(archive_path, output_dir, relative_to, extractors=None):
         raise ChildProcessError()
 
     _process_relative_to(output_dir, relative_to)
+    _prune_skipped(output_dir, skip_paths)
 
 
-def extract_with_winrar(archive_path, output_dir, relative_to, extractors=None):
+def extract_with_winrar(archive_path, output_dir, relative_to, extractors=None, skip_paths=None):
     """
     Extract archives with WinRAR into the output directory.
     Only supports archives with one layer of unpacking, so compressed tar archives don't work.
@@ -290,6 +732,8 @@ def extract_with_winrar(archive_path, output_dir, relative_to, extractors=None):
     root of the archive.
     extractors is a dictionary of PlatformEnum to a command or path to the
     extractor binary. Defaults to 'tar' for tar, and '_use_registry' for WinRAR.
+    skip_paths is a set of POSIX paths of files relative to output_dir that are deleted
+    after unpacking, or None.
     """
     if extractors is None:
         extractors = DEFAULT_EXTRACTORS
@@ -314,3 +758,4 @@ def extract_with_winrar(archive_path, output_dir, relative_to, extractors=None):
         raise ChildProcessError()
 
     _process_relative_to(output_dir, relative_to)
+    _prune_skipped(output_dir, skip_paths)
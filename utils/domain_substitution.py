@@ -7,38 +7,75 @@
 """
 Substitute domain names in the source tree with blockable strings.
 """
+# pylint: disable=too-many-lines
 
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 import argparse
 import collections
+import concurrent.futures
 import contextlib
+import functools
+import hashlib
+import heapq
 import io
+import mmap
+import multiprocessing
 import os
 import stat
 import re
+import shutil
 import tarfile
-import tempfile
+import time
 import zlib
 
-from _extraction import extract_tar_file
 from _common import ENCODING, get_logger, add_common_params
 
 # Encodings to try on source tree files
 TREE_ENCODINGS = ('UTF-8', 'ISO-8859-1')
 
 # Constants for domain substitution cache
+# Compression of the cache by file suffix. Caches with other suffixes are not compressed.
+_CACHE_COMPRESSION = {'.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
 _INDEX_LIST = 'cache_index.list'
+_REVERTED_LIST = 'cache_reverted.list'
 _INDEX_HASH_DELIMITER = '|'
 _ORIG_DIR = 'orig'
 
+# Size of chunks to read when hashing files
+_HASH_CHUNK_BYTES = 262144
+
+# Constants for the incremental substitution index
+_INCREMENTAL_INDEX_LIST = 'index.list'
+_INCREMENTAL_OBJECTS_DIR = 'objects'
+
 # Constants for timestamp manipulation
 # Delta between all file timestamps in nanoseconds
 _TIMESTAMP_DELTA = 1 * 10**9
 
+# Number of files handed to a worker process at a time
+_WORKER_CHUNKSIZE = 16
+
+# Defined at module level so that regex pairs can be pickled for worker processes
+DomainRegexPair = collections.namedtuple('DomainRegexPair', ('pattern', 'replacement', 'literal'),
+                                         defaults=(None, ))
+
+# Characters with special meaning outside of character classes
+_REGEX_METACHARS = frozenset('.^$*+?{}[]\\|()')
+# Characters that make the preceding item optional or repeated
+_REGEX_QUANTIFIERS = frozenset('*+?{')
+# Bounds of a repetition. Other braces are literal characters.
+_REGEX_BOUNDS = re.compile(r'\{\d*(,\d*)?\}')
+# Escapes that are followed by more than one character
+_REGEX_MULTICHAR_ESCAPES = frozenset('xuUN0123456789')
+# Inline flags and comments that can change how literal characters match
+_REGEX_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux#-]')
+# Escapes that match differently on ASCII content between str and bytes patterns
+_REGEX_UNICODE_ESCAPES = frozenset('sS')
+
 
 class DomainRegexList:
     """Representation of a domain_regex.list file"""
-    _regex_pair_tuple = collections.namedtuple('DomainRegexPair', ('pattern', 'replacement'))
+    _regex_pair_tuple = DomainRegexPair
 
     # Constants for format:
     _PATTERN_REPLACE_DELIM = '#'
@@ -48,11 +85,12 @@ class DomainRegexList:
 
         # Cache of compiled regex pairs
         self._compiled_regex = None
+        self._compiled_bytes_regex = None
 
     def _compile_regex(self, line):
         """Generates a regex pair tuple for the given line"""
         pattern, replacement = line.split(self._PATTERN_REPLACE_DELIM)
-        return self._regex_pair_tuple(re.compile(pattern), replacement)
+        return self._regex_pair_tuple(re.compile(pattern), replacement, _required_literal(pattern))
 
     @property
     def regex_pairs(self):
@@ -63,6 +101,31 @@ class DomainRegexList:
             self._compiled_regex = tuple(map(self._compile_regex, self._data))
         return self._compiled_regex
 
+    @property
+    def bytes_regex_pairs(self):
+        """
+        Returns a tuple of compiled regex pairs for substituting ASCII bytes content,
+            or None if a pattern cannot be used on bytes.
+
+        For ASCII content, the bytes regex pairs give the same result as regex_pairs.
+        """
+        if not self._compiled_bytes_regex:
+            if not all(map(_is_bytes_compatible, self._data)):
+                return None
+            self._compiled_bytes_regex = tuple(
+                self._regex_pair_tuple(re.compile(pair.pattern.pattern.encode(
+                )), pair.replacement.encode(), pair.literal and pair.literal.encode())
+                for pair in self.regex_pairs)
+        return self._compiled_bytes_regex
+
+    @property
+    def search_literals(self):
+        """
+        Returns a tuple of byte strings of which at least one appears in the raw content
+            of every file that a regex matches, or None if this cannot be determined.
+        """
+        return _search_literals(self.regex_pairs)
+
     @property
     def search_regex(self):
         """
@@ -72,63 +135,491 @@ class DomainRegexList:
             map(lambda x: x.split(self._PATTERN_REPLACE_DELIM, 1)[0], self._data)))
 
 
+class SubstitutionCacheWriter:
+    """
+    Substitutes domains in files as they are unpacked, and writes a domain substitution
+        cache like apply_substitution()
+    """
+
+    def __init__(self, regex_path, domainsub_cache):
+        """
+        regex_path is a pathlib.Path to domain_regex.list
+        domainsub_cache is a pathlib.Path to the domain substitution cache to create.
+            It is compressed like in apply_substitution()
+
+        Raises FileExistsError if the domain substitution cache already exists.
+        """
+        if domainsub_cache.exists():
+            raise FileExistsError(domainsub_cache)
+        self._regex_list = DomainRegexList(regex_path)
+        self._cache_tar = _open_cache_for_writing(domainsub_cache)
+        self._fileindex_content = io.BytesIO()
+        self._unpacked_paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                _add_cache_member(self._cache_tar, _INDEX_LIST, self._fileindex_content.getvalue())
+        finally:
+            self._cache_tar.close()
+
+    def _add_file(self, relative_path, crc32_hash, orig_content):
+        """Adds the original content of a substituted file to the cache"""
+        self._fileindex_content.write(
+            f'{relative_path}{_INDEX_HASH_DELIMITER}{crc32_hash:08x}\n'.encode(ENCODING))
+        _add_cache_member(self._cache_tar, str(Path(_ORIG_DIR) / relative_path), orig_content)
+
+    def substitute_content(self, relative_path, orig_content):
+        """
+        Returns the domain substituted raw content of the file at relative_path that is
+            being unpacked. The original content is added to the cache if it was substituted.
+
+        Raises UnicodeDecodeError if the content cannot be decoded.
+        """
+        self._unpacked_paths.append(relative_path)
+        substituted_content = None
+        if orig_content:
+            substituted_content = _substitute_content(orig_content, self._regex_list.regex_pairs,
+                                                      self._regex_list.bytes_regex_pairs)
+        if substituted_content is None:
+            return orig_content
+        self._add_file(relative_path, zlib.crc32(substituted_content), orig_content)
+        return substituted_content
+
+    def finish_unpacked(self, source_tree):
+        """
+        Updates the timestamps of the files passed to substitute_content() once they
+            are unpacked to source_tree, so that they are the same as after apply_substitution()
+
+        Returns a frozenset of the relative paths of these files.
+        """
+        resolved_tree = source_tree.resolve()
+        for relative_path in self._unpacked_paths:
+            with _update_timestamp(resolved_tree / relative_path, set_new=True):
+                pass
+        unpacked_paths = frozenset(self._unpacked_paths)
+        self._unpacked_paths.clear()
+        return unpacked_paths
+
+    def substitute_files(self, relative_paths, source_tree):
+        """
+        Substitutes domains in files that are already in source_tree like apply_substitution()
+
+        relative_paths is an iterable of paths of files relative to source_tree
+        source_tree is a pathlib.Path to the source tree.
+        """
+        substitute_file = functools.partial(_substitute_file,
+                                            resolved_tree=source_tree.resolve(),
+                                            regex_pairs=self._regex_list.regex_pairs,
+                                            bytes_regex_pairs=self._regex_list.bytes_regex_pairs,
+                                            index_objects=None)
+        for relative_path, crc32_hash, orig_content, _ in map(substitute_file,
+                                                              ((x, None) for x in relative_paths)):
+            if crc32_hash is not None:
+                self._add_file(relative_path, crc32_hash, orig_content)
+
+
 # Private Methods
 
 
-def _substitute_path(path, regex_iter):
+def _skip_regex_class(pattern, index):
+    """Returns the index after the character class starting at pattern[index]"""
+    index += 1
+    if pattern.startswith('^', index):
+        index += 1
+    if pattern.startswith(']', index):
+        index += 1
+    while index < len(pattern) and pattern[index] != ']':
+        index += 2 if pattern[index] == '\\' else 1
+    return index + 1
+
+
+def _skip_regex_bounds(pattern, index):
+    """Returns the index after the repetition bounds starting at pattern[index]"""
+    return _REGEX_BOUNDS.match(pattern, index).end()
+
+
+def _required_literal(pattern):
     """
-    Perform domain substitution on path and add it to the domain substitution cache.
+    Returns the longest literal string that must appear in every match of the
+        regular expression pattern, or None if no such string could be determined.
+
+    Only literal characters outside of groups and character classes are considered,
+        so the result is conservative.
+    """
+    if _REGEX_INLINE_FLAGS.search(pattern):
+        return None
+    literal_runs = []
+    current_run = []
+    depth = 0
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        literal = None
+        # Literal braces are not tracked, since they can hide alternatives
+        literal_brace = char == '{' and not _REGEX_BOUNDS.match(pattern, index)
+        if char == '\\':
+            escaped = pattern[index + 1:index + 2]
+            if escaped in _REGEX_MULTICHAR_ESCAPES:
+                return None
+            if depth == 0 and escaped and not escaped.isalnum():
+                literal = escaped
+            index += 2
+        elif (char == '|' and depth == 0) or literal_brace:
+            return None
+        elif char in '[{':
+            # Neither character classes nor the bounds of repetitions are literal characters
+            skip_func = _skip_regex_class if char == '[' else _skip_regex_bounds
+            index = skip_func(pattern, index)
+        elif char in '()':
+            depth += 1 if char == '(' else -1
+            index += 1
+        else:
+            if depth == 0 and char not in _REGEX_METACHARS:
+                literal = char
+            index += 1
+        if literal is None or pattern[index:index + 1] in _REGEX_QUANTIFIERS:
+            # An optional or repeated item cannot be part of the required literal
+            literal_runs.append(''.join(current_run))
+            current_run = []
+        else:
+            current_run.append(literal)
+    literal_runs.append(''.join(current_run))
+    return max(literal_runs, key=len) or None
+
+
+def _is_bytes_compatible(line):
+    """
+    Returns True if the domain_regex.list line can be used on ASCII bytes content
+        with the same result as on str content; False otherwise.
+    """
+    if not line.isascii():
+        return False
+    return not _REGEX_UNICODE_ESCAPES.intersection(re.findall(r'\\(.)', line))
+
+
+def _search_literals(regex_iter):
+    """
+    Returns a tuple of the required literals of the regex pairs in regex_iter as byte strings,
+        or None if any regex has no required literal that is ASCII.
+
+    Since all TREE_ENCODINGS are ASCII-compatible, a regex can only match the decoded content
+        of a file if the raw content contains its ASCII required literal.
+    """
+    literals = []
+    for regex_pair in regex_iter:
+        literal = regex_pair.literal
+        if isinstance(literal, str):
+            if not literal.isascii():
+                return None
+            literal = literal.encode()
+        if not literal:
+            return None
+        literals.append(literal)
+    return tuple(literals)
+
+
+@contextlib.contextmanager
+def _map_file(file_obj):
+    """
+    Context manager that memory-maps the file object for reading.
+        It yields an empty bytes object for an empty file, which cannot be mapped.
+
+    The map must be closed before the file is resized.
+    """
+    if not os.fstat(file_obj.fileno()).st_size:
+        yield b''
+        return
+    with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def _decode_content(original_content, regex_iter, bytes_regex_iter=None):
+    """
+    Prepares the raw content of a file for substitution.
+
+    regex_iter and bytes_regex_iter are like in _substitute_content()
+
+    Returns a tuple of the content to substitute, the encoding to encode it back with or
+        None if it is bytes, and the regex pairs to substitute it with.
+
+    Raises UnicodeDecodeError if the content cannot be decoded.
+    """
+    if bytes_regex_iter is not None and original_content.isascii():
+        return (original_content, None, bytes_regex_iter)
+    decode_error = None
+    for encoding in TREE_ENCODINGS:
+        try:
+            return (original_content.decode(encoding), encoding, regex_iter)
+        except UnicodeDecodeError as exc:
+            decode_error = exc
+    raise decode_error
+
+
+def _substitute_content(original_content, regex_iter, bytes_regex_iter=None):
+    """
+    Perform domain substitution on the raw content of a file.
 
-    path is a pathlib.Path to the file to be domain substituted.
     regex_iter is an iterable of regular expression namedtuple like from
         config.DomainRegexList.regex_pairs()
+        A regex is skipped if its required literal does not appear in the content,
+        since it cannot match. This gives the same result as applying every regex.
+    bytes_regex_iter is an optional iterable like from DomainRegexList.bytes_regex_pairs
+        It is used instead of regex_iter for ASCII content to avoid decoding and encoding.
 
-    Returns a tuple of the CRC32 hash of the substituted raw content and the
-        original raw content; None for both entries if no substitutions were made.
+    Returns the substituted raw content; None if no substitutions were made.
 
-    Raises FileNotFoundError if path does not exist.
-    Raises UnicodeDecodeError if path's contents cannot be decoded.
+    Raises UnicodeDecodeError if the content cannot be decoded.
     """
+    content, encoding, regex_iter = _decode_content(original_content, regex_iter, bytes_regex_iter)
+    file_subs = 0
+    for regex_pair in regex_iter:
+        if regex_pair.literal is not None and regex_pair.literal not in content:
+            continue
+        content, sub_count = regex_pair.pattern.subn(regex_pair.replacement, content)
+        file_subs += sub_count
+    if file_subs > 0:
+        return content if encoding is None else content.encode(encoding)
+    return None
+
+
+def _make_writable(path):
+    """Adds write permission to path if it is missing"""
     if not os.access(path, os.W_OK):
         # If the patch cannot be written to, it cannot be opened for updating
         print(str(path) + " cannot be opened for writing! Adding write permission...")
         path.chmod(path.stat().st_mode | stat.S_IWUSR)
+
+
+def _rewrite_file(file_obj, content):
+    """Replaces the content of the file object opened for updating"""
+    file_obj.seek(0)
+    file_obj.write(content)
+    file_obj.truncate()
+
+
+def _substitute_path(path, regex_iter, bytes_regex_iter=None):
+    """
+    Perform domain substitution on path and add it to the domain substitution cache.
+
+    path is a pathlib.Path to the file to be domain substituted.
+    regex_iter and bytes_regex_iter are like in _substitute_content()
+
+    Returns a tuple of the CRC32 hash of the substituted raw content and the
+        original raw content; None for both entries if no substitutions were made.
+
+    Raises FileNotFoundError if path does not exist.
+    Raises UnicodeDecodeError if path's contents cannot be decoded.
+    """
+    # The regexes are read once for the literals and again for the substitution
+    regex_iter = tuple(regex_iter)
+    _make_writable(path)
     with path.open('r+b') as input_file:
+        # Most files have no matches, so avoid reading them into memory
+        if not may_match(input_file, _search_literals(regex_iter)):
+            return (None, None)
         original_content = input_file.read()
         if not original_content:
             return (None, None)
-        content = None
-        encoding = None
-        for encoding in TREE_ENCODINGS:
-            try:
-                content = original_content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        if not content:
-            raise UnicodeDecodeError(f'Unable to decode with any encoding: {path}')
-        file_subs = 0
-        for regex_pair in regex_iter:
-            content, sub_count = regex_pair.pattern.subn(regex_pair.replacement, content)
-            file_subs += sub_count
-        if file_subs > 0:
-            substituted_content = content.encode(encoding)
-            input_file.seek(0)
-            input_file.write(content.encode(encoding))
-            input_file.truncate()
-            return (zlib.crc32(substituted_content), original_content)
-        return (None, None)
+        substituted_content = _substitute_content(original_content, regex_iter, bytes_regex_iter)
+        if substituted_content is None:
+            return (None, None)
+        _rewrite_file(input_file, substituted_content)
+        return (zlib.crc32(substituted_content), original_content)
+
+
+def _substitute_path_incremental(path, regex_iter, bytes_regex_iter, index_entry, index_objects):
+    """
+    Like _substitute_path(), but reuses the results of previous runs from the
+        incremental substitution index.
+
+    index_entry is a tuple of the SHA-256 digests of the original and substituted content
+        of path from a previous run, or None if there is no previous run.
+        The substituted digest is empty if there were no substitutions.
+    index_objects is a pathlib.Path to the directory of substituted contents by digest.
+
+    Returns a tuple like _substitute_path() with the new index entry of path appended.
+    """
+    regex_iter = tuple(regex_iter)
+    _make_writable(path)
+    with path.open('r+b') as input_file:
+        with _map_file(input_file) as mapped:
+            orig_digest = hashlib.sha256(mapped).hexdigest()
+        if index_entry is not None and index_entry[0] == orig_digest and not index_entry[1]:
+            return (None, None, index_entry)
+        if not may_match(input_file, _search_literals(regex_iter)):
+            return (None, None, (orig_digest, ''))
+        original_content = input_file.read()
+        substituted_content = None
+        if index_entry is not None and index_entry[0] == orig_digest:
+            with contextlib.suppress(FileNotFoundError):
+                substituted_content = (index_objects / index_entry[1]).read_bytes()
+        if substituted_content is None and original_content:
+            substituted_content = _substitute_content(original_content, regex_iter,
+                                                      bytes_regex_iter)
+        if substituted_content is None:
+            return (None, None, (orig_digest, ''))
+        subst_digest = hashlib.sha256(substituted_content).hexdigest()
+        object_path = index_objects / subst_digest
+        if not object_path.exists():
+            tmp_object_path = object_path.with_name(f'{subst_digest}.{os.getpid()}.tmp')
+            tmp_object_path.write_bytes(substituted_content)
+            tmp_object_path.replace(object_path)
+        _rewrite_file(input_file, substituted_content)
+        return (zlib.crc32(substituted_content), original_content, (orig_digest, subst_digest))
 
 
-def _validate_file_index(index_file, resolved_tree, cache_index_files):
+def _substitute_file(file_entry, resolved_tree, regex_pairs, bytes_regex_pairs, index_objects):
+    """
+    Perform domain substitution on a single file of the source tree.
+
+    file_entry is a tuple of the path of the file from domain_substitution.list and
+        its entry in the incremental substitution index, or None.
+    resolved_tree is the resolved pathlib.Path to the source tree
+    regex_pairs is a tuple of regular expression namedtuples like from
+        DomainRegexList.regex_pairs
+    bytes_regex_pairs is the corresponding DomainRegexList.bytes_regex_pairs
+    index_objects is a pathlib.Path to the objects of the incremental substitution index,
+        or None if it is not used.
+
+    Returns a tuple of relative_path, the CRC32 hash of the substituted raw content,
+        the original raw content and the new incremental substitution index entry.
+        The hash and content are None if no substitutions were made, and the index entry
+        is None if the file was skipped or the index is not used.
+    """
+    relative_path, index_entry = file_entry
+    path = resolved_tree / relative_path
+    if not path.exists():
+        get_logger().warning('Skipping non-existent path: %s', path)
+        return (relative_path, None, None, None)
+    if path.is_symlink():
+        get_logger().warning('Skipping path that has become a symlink: %s', path)
+        return (relative_path, None, None, None)
+    with _update_timestamp(path, set_new=True):
+        if index_objects is None:
+            crc32_hash, orig_content = _substitute_path(path, regex_pairs, bytes_regex_pairs)
+            index_entry = None
+        else:
+            crc32_hash, orig_content, index_entry = _substitute_path_incremental(
+                path, regex_pairs, bytes_regex_pairs, index_entry, index_objects)
+    if crc32_hash is None:
+        get_logger().info('Path has no substitutions: %s', relative_path)
+    return (relative_path, crc32_hash, orig_content, index_entry)
+
+
+def _open_cache_for_writing(domainsub_cache):
+    """
+    Returns a new tarfile.TarFile for the domain substitution cache.
+        The compression is chosen by the file suffix.
+    """
+    compression = _CACHE_COMPRESSION.get(domainsub_cache.suffix)
+    if compression is None:
+        return tarfile.open(str(domainsub_cache), 'w:')
+    if compression == 'xz':
+        return tarfile.open(str(domainsub_cache), 'w:xz', preset=1)
+    return tarfile.open(str(domainsub_cache), f'w:{compression}', compresslevel=1)
+
+
+def _read_files_list(files_path):
+    """
+    Returns a tuple of the relative paths in domain_substitution.list
+
+    Raises ValueError if an entry contains the file index hash delimiter.
+    """
+    relative_paths = tuple(filter(len, files_path.read_text().splitlines()))
+    for relative_path in relative_paths:
+        if _INDEX_HASH_DELIMITER in relative_path:
+            raise ValueError(f'Path "{relative_path}" contains '
+                             f'the file index hash delimiter "{_INDEX_HASH_DELIMITER}"')
+    return relative_paths
+
+
+def _read_incremental_index(index_dir, regex_digest):
+    """
+    Returns a dictionary of relative paths to entries of the incremental substitution index
+        in index_dir. The index is discarded if it was made with a different domain_regex.list
+
+    index_dir is a pathlib.Path to the index directory. It is created if it does not exist.
+    regex_digest is the SHA-256 digest of domain_regex.list
+    """
+    try:
+        index_lines = (index_dir /
+                       _INCREMENTAL_INDEX_LIST).read_text(encoding=ENCODING).splitlines()
+    except FileNotFoundError:
+        index_lines = []
+    if not index_lines or index_lines[0] != regex_digest:
+        if index_lines:
+            get_logger().info('domain_regex.list has changed. Discarding incremental index.')
+        shutil.rmtree(index_dir / _INCREMENTAL_OBJECTS_DIR, ignore_errors=True)
+        index_lines = [regex_digest]
+    (index_dir / _INCREMENTAL_OBJECTS_DIR).mkdir(parents=True, exist_ok=True)
+    index_entries = {}
+    for entry in index_lines[1:]:
+        relative_path, orig_digest, subst_digest = entry.split(_INDEX_HASH_DELIMITER)
+        index_entries[relative_path] = (orig_digest, subst_digest)
+    return index_entries
+
+
+def _write_incremental_index(index_dir, regex_digest, index_entries):
+    """
+    Writes the incremental substitution index and removes substituted contents
+        that are no longer referenced by it.
+
+    index_dir is a pathlib.Path to the index directory.
+    regex_digest is the SHA-256 digest of domain_regex.list
+    index_entries is a dictionary like from _read_incremental_index()
+    """
+    tmp_index_path = index_dir / f'{_INCREMENTAL_INDEX_LIST}.tmp'
+    with tmp_index_path.open('w', encoding=ENCODING) as index_file:
+        index_file.write(f'{regex_digest}\n')
+        for relative_path, index_entry in index_entries.items():
+            index_file.write(f'{_INDEX_HASH_DELIMITER.join((relative_path, *index_entry))}\n')
+    tmp_index_path.replace(index_dir / _INCREMENTAL_INDEX_LIST)
+    used_digests = set(subst_digest for _, subst_digest in index_entries.values())
+    for object_path in (index_dir / _INCREMENTAL_OBJECTS_DIR).iterdir():
+        if object_path.name not in used_digests:
+            object_path.unlink()
+
+
+def _file_hash_matches(resolved_tree, index_entry):
+    """
+    Returns True if the CRC32 hash of a file in the source tree matches its
+        file index entry; False otherwise. The file is hashed in chunks.
+
+    resolved_tree is the resolved pathlib.Path to the source tree
+    index_entry is a tuple of the relative path of the file and its expected CRC32 hash
+    """
+    relative_path, expected_hash = index_entry
+    crc32_hash = 0
+    try:
+        with (resolved_tree / relative_path).open('rb') as file_obj:
+            for chunk in iter(functools.partial(file_obj.read, _HASH_CHUNK_BYTES), b''):
+                crc32_hash = zlib.crc32(chunk, crc32_hash)
+    except FileNotFoundError:
+        get_logger().error('File from file index does not exist: %s', relative_path)
+        return False
+    if crc32_hash != expected_hash:
+        get_logger().error('Hashes do not match for: %s', relative_path)
+        return False
+    return True
+
+
+def _validate_file_index(index_file, resolved_tree, cache_index_files, jobs=1, paths=None):
     """
     Validation of file index and hashes against the source tree.
         Updates cache_index_files
+    Files are hashed concurrently by jobs threads, and all mismatches are reported.
+    If paths is not None, only the hashes of files in paths are validated, and
+        every path must be in the file index.
 
     Returns True if the file index is valid; False otherwise
     """
     all_hashes_valid = True
     crc32_regex = re.compile(r'^[a-zA-Z0-9]{8}$')
+    expected_hashes = {}
     for entry in index_file.read().decode(ENCODING).splitlines():
         try:
             relative_path, file_hash = entry.split(_INDEX_HASH_DELIMITER)
@@ -145,18 +636,131 @@ def _validate_file_index(index_file, resolved_tree, cache_index_files):
                                relative_path)
             all_hashes_valid = False
             continue
-        if zlib.crc32((resolved_tree / relative_path).read_bytes()) != int(file_hash, 16):
-            get_logger().error('Hashes do not match for: %s', relative_path)
-            all_hashes_valid = False
-            continue
-        if relative_path in cache_index_files:
+        if relative_path in expected_hashes:
             get_logger().error('File %s shows up at least twice in the file index', relative_path)
             all_hashes_valid = False
             continue
-        cache_index_files.add(relative_path)
+        expected_hashes[relative_path] = int(file_hash, 16)
+    if paths is not None:
+        for relative_path in sorted(set(paths).difference(expected_hashes)):
+            get_logger().error('File %s is not in the file index', relative_path)
+            all_hashes_valid = False
+        expected_hashes = {x: y for x, y in expected_hashes.items() if x in paths}
+    # zlib.crc32() releases the GIL, so hashing scales with threads
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes_match = executor.map(functools.partial(_file_hash_matches, resolved_tree),
+                                    expected_hashes.items())
+        for relative_path, hash_matches in zip(expected_hashes, hashes_match):
+            if hash_matches:
+                cache_index_files.add(relative_path)
+            else:
+                all_hashes_valid = False
     return all_hashes_valid
 
 
+def _read_cache_members(cache_tar):
+    """
+    Reads the members of the domain substitution cache.
+
+    Returns a tuple of a dictionary of member names to tarfile.TarInfo without the files
+        reverted by partial reverts, the set of files reverted by partial reverts, and
+        the raw content of the file index.
+
+    Raises KeyError if the file index is missing.
+    """
+    # For uncompressed caches, this only reads the member headers and the lists.
+    # The lists are read as they are reached, so that compressed caches are not rewound.
+    # Members appended by partial reverts supersede earlier ones with the same name.
+    cache_members = {}
+    list_contents = {}
+    for member in cache_tar:
+        if member.name in (_INDEX_LIST, _REVERTED_LIST):
+            with cache_tar.extractfile(member) as list_file:
+                list_contents[member.name] = list_file.read()
+        else:
+            cache_members[member.name] = member
+    if _INDEX_LIST not in list_contents:
+        raise KeyError('Domain substitution cache file index is missing.')
+    reverted_files = set(list_contents.get(_REVERTED_LIST, b'').decode(ENCODING).splitlines())
+    for relative_path in reverted_files:
+        cache_members.pop(str(Path(_ORIG_DIR) / relative_path), None)
+    return cache_members, reverted_files, list_contents[_INDEX_LIST]
+
+
+def _pop_orig_member(cache_members, relative_path):
+    """
+    Removes and returns the tarfile.TarInfo of the original file for relative_path
+        from a dictionary like from _read_cache_members()
+
+    Raises KeyError if the cache does not contain the original file.
+    """
+    try:
+        return cache_members.pop(str(Path(_ORIG_DIR) / relative_path))
+    except KeyError as exc:
+        raise KeyError('Domain substitution cache is not consistent with the file index: '
+                       f'{relative_path}') from exc
+
+
+def _add_cache_member(cache_tar, name, content):
+    """Adds a file with the given raw content to the domain substitution cache"""
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = len(content)
+    with io.BytesIO(content) as content_file:
+        cache_tar.addfile(tarinfo, content_file)
+
+
+def _remove_reverted_files(domainsub_cache, index_content, reverted_files):
+    """
+    Removes reverted files from the file index of the domain substitution cache.
+
+    Uncompressed caches are appended with a new file index and list of reverted files,
+        which supersede the previous ones. Compressed caches cannot be appended to,
+        so they are rewritten without the reverted files.
+
+    domainsub_cache is a pathlib.Path to the domain substitution cache.
+    index_content is the raw content of the current file index
+    reverted_files is a set of the relative paths of all files reverted from the cache
+    """
+    new_index_content = b''.join(
+        entry + b'\n' for entry in index_content.splitlines()
+        if entry.decode(ENCODING).split(_INDEX_HASH_DELIMITER)[0] not in reverted_files)
+    if domainsub_cache.suffix not in _CACHE_COMPRESSION:
+        with tarfile.open(str(domainsub_cache), 'a') as cache_tar:
+            _add_cache_member(cache_tar, _INDEX_LIST, new_index_content)
+            _add_cache_member(cache_tar, _REVERTED_LIST,
+                              '\n'.join(sorted(reverted_files)).encode(ENCODING))
+        return
+    skipped_names = {_INDEX_LIST, *(str(Path(_ORIG_DIR) / x) for x in reverted_files)}
+    new_cache = domainsub_cache.with_name(f'partial_{domainsub_cache.name}')
+    with tarfile.open(str(domainsub_cache), 'r') as cache_tar, \
+            _open_cache_for_writing(new_cache) as new_cache_tar:
+        for member in cache_tar:
+            if member.name not in skipped_names:
+                new_cache_tar.addfile(member, cache_tar.extractfile(member))
+        _add_cache_member(new_cache_tar, _INDEX_LIST, new_index_content)
+    new_cache.replace(domainsub_cache)
+
+
+def _write_orig_files(cache_tar, orig_members, resolved_tree):
+    """
+    Writes original files from the domain substitution cache over the substituted files.
+
+    cache_tar is the tarfile.TarFile of the domain substitution cache
+    orig_members is an iterable of tuples of relative paths and their tarfile.TarInfo
+    resolved_tree is the resolved pathlib.Path to the source tree
+    """
+    # Write in archive order, so that compressed caches are read in one more pass
+    for relative_path, orig_member in sorted(orig_members, key=lambda x: x[1].offset_data):
+        path = resolved_tree / relative_path
+        with _update_timestamp(path, set_new=False):
+            # Replace the file instead of writing through symlinks or hard links
+            mode = stat.S_IMODE(path.stat().st_mode)
+            path.unlink()
+            with cache_tar.extractfile(orig_member) as orig_file, path.open('xb') as output_file:
+                shutil.copyfileobj(orig_file, output_file)
+            path.chmod(mode)
+
+
 @contextlib.contextmanager
 def _update_timestamp(path: os.PathLike, set_new: bool) -> None:
     """
@@ -179,7 +783,27 @@ def _update_timestamp(path: os.PathLike, set_new: bool) -> None:
 # Public Methods
 
 
-def apply_substitution(regex_path, files_path, source_tree, domainsub_cache):
+def may_match(file_obj, literals):
+    """
+    Returns False if none of the regexes can match the content of the file object;
+        True otherwise. The file is memory-mapped so that it is not read into memory.
+
+    literals is a tuple like from DomainRegexList.search_literals, or None to always
+        return True.
+    """
+    if literals is None:
+        return True
+    with _map_file(file_obj) as mapped:
+        return any(mapped.find(literal) != -1 for literal in literals)
+
+
+def apply_substitution( #pylint: disable=too-many-arguments,too-many-locals
+        regex_path,
+        files_path,
+        source_tree,
+        domainsub_cache,
+        jobs=1,
+        index_dir=None):
     """
     Substitute domains in source_tree with files and substitutions,
         and save the pre-domain substitution archive to presubdom_archive.
@@ -188,6 +812,13 @@ def apply_substitution(regex_path, files_path, source_tree, domainsub_cache):
     files_path is a pathlib.Path to domain_substitution.list
     source_tree is a pathlib.Path to the source tree.
     domainsub_cache is a pathlib.Path to the domain substitution cache.
+        It is compressed for the suffixes .gz, .bz2 and .xz and uncompressed otherwise.
+        Uncompressed caches are faster to revert.
+    jobs is the number of worker processes used to substitute files. The resulting
+        source tree and cache are the same regardless of the number of jobs.
+    index_dir is a pathlib.Path to the incremental substitution index, or None to not use one.
+        It records the content hashes of files from previous runs, so that files without
+        substitutions are skipped and substituted contents are reused.
 
     Raises NotADirectoryError if the patches directory is not a directory or does not exist
     Raises FileNotFoundError if the source tree or required directory does not exist.
@@ -204,49 +835,51 @@ def apply_substitution(regex_path, files_path, source_tree, domainsub_cache):
     if domainsub_cache and domainsub_cache.exists():
         raise FileExistsError(domainsub_cache)
     resolved_tree = source_tree.resolve()
-    regex_pairs = DomainRegexList(regex_path).regex_pairs
+    regex_list = DomainRegexList(regex_path)
+    relative_paths = _read_files_list(files_path)
+    index_entries = {}
+    index_objects = None
+    if index_dir:
+        regex_digest = hashlib.sha256(regex_path.read_bytes()).hexdigest()
+        index_entries = _read_incremental_index(index_dir, regex_digest)
+        index_objects = index_dir / _INCREMENTAL_OBJECTS_DIR
+    file_entries = tuple((x, index_entries.get(x)) for x in relative_paths)
+    substitute_file = functools.partial(_substitute_file,
+                                        resolved_tree=resolved_tree,
+                                        regex_pairs=regex_list.regex_pairs,
+                                        bytes_regex_pairs=regex_list.bytes_regex_pairs,
+                                        index_objects=index_objects)
+    new_index_entries = {}
     fileindex_content = io.BytesIO()
-    with tarfile.open(str(domainsub_cache), f'w:{domainsub_cache.suffix[1:]}',
-                      compresslevel=1) if domainsub_cache else open(
-                          os.devnull, 'w', encoding=ENCODING) as cache_tar:
-        for relative_path in filter(len, files_path.read_text().splitlines()):
-            if _INDEX_HASH_DELIMITER in relative_path:
-                if domainsub_cache:
-                    # Cache tar will be incomplete; remove it for convenience
-                    cache_tar.close()
-                    domainsub_cache.unlink()
-                raise ValueError(f'Path "{relative_path}" contains '
-                                 f'the file index hash delimiter "{_INDEX_HASH_DELIMITER}"')
-            path = resolved_tree / relative_path
-            if not path.exists():
-                get_logger().warning('Skipping non-existent path: %s', path)
-                continue
-            if path.is_symlink():
-                get_logger().warning('Skipping path that has become a symlink: %s', path)
-                continue
-            with _update_timestamp(path, set_new=True):
-                crc32_hash, orig_content = _substitute_path(path, regex_pairs)
-            if crc32_hash is None:
-                get_logger().info('Path has no substitutions: %s', relative_path)
-                continue
-            if domainsub_cache:
+    with contextlib.ExitStack() as exit_stack:
+        if jobs > 1:
+            worker_pool = exit_stack.enter_context(multiprocessing.Pool(jobs))
+            # imap() yields in submission order, so the cache is written in list order
+            results = worker_pool.imap(substitute_file, file_entries, _WORKER_CHUNKSIZE)
+        else:
+            results = map(substitute_file, file_entries)
+        with _open_cache_for_writing(domainsub_cache) if domainsub_cache else open(
+                os.devnull, 'w', encoding=ENCODING) as cache_tar:
+            for relative_path, crc32_hash, orig_content, index_entry in results:
+                if index_entry is not None:
+                    new_index_entries[relative_path] = index_entry
+                if crc32_hash is None or not domainsub_cache:
+                    continue
                 fileindex_content.write(
                     f'{relative_path}{_INDEX_HASH_DELIMITER}{crc32_hash:08x}\n'.encode(ENCODING))
-                orig_tarinfo = tarfile.TarInfo(str(Path(_ORIG_DIR) / relative_path))
-                orig_tarinfo.size = len(orig_content)
-                with io.BytesIO(orig_content) as orig_file:
-                    cache_tar.addfile(orig_tarinfo, orig_file)
-        if domainsub_cache:
-            fileindex_tarinfo = tarfile.TarInfo(_INDEX_LIST)
-            fileindex_tarinfo.size = fileindex_content.tell()
-            fileindex_content.seek(0)
-            cache_tar.addfile(fileindex_tarinfo, fileindex_content)
+                _add_cache_member(cache_tar, str(Path(_ORIG_DIR) / relative_path), orig_content)
+            if domainsub_cache:
+                _add_cache_member(cache_tar, _INDEX_LIST, fileindex_content.getvalue())
+    if index_dir:
+        _write_incremental_index(index_dir, regex_digest, new_index_entries)
 
 
-def revert_substitution(domainsub_cache, source_tree):
+def revert_substitution(domainsub_cache, source_tree, jobs=1, paths=None):
     """
     Revert domain substitution on source_tree using the pre-domain
         substitution archive presubdom_archive.
+    The original files are written directly from the archive into source_tree without
+        extracting the archive first.
     It first checks if the hashes of the substituted files match the hashes
         computed during the creation of the domain substitution cache, raising
         KeyError if there are any mismatches. Then, it proceeds to
@@ -256,18 +889,21 @@ def revert_substitution(domainsub_cache, source_tree):
 
     domainsub_cache is a pathlib.Path to the domain substitution cache.
     source_tree is a pathlib.Path to the source tree.
+    jobs is the number of threads used to validate the hashes of substituted files.
+    paths is an iterable of relative paths of the files to revert, or None to revert all
+        files. They are normalized, so that ./foo/bar.cc and foo//bar.cc are foo/bar.cc.
+        The reverted files are removed from the cache's file index, so that the remaining
+        files can be reverted later.
 
     Raises KeyError if:
         * There is a hash mismatch while validating the cache
         * The cache's file index is corrupt or missing
         * The cache is corrupt or is not consistent with the file index
+        * A path in paths is not in the cache's file index
     Raises FileNotFoundError if the source tree or domain substitution cache do not exist.
     """
-    # This implementation trades disk space/wear for performance (unless a ramdisk is used
-    #   for the source tree)
     # Assumptions made for this process:
-    # * The correct tar file was provided (so no huge amount of space is wasted)
-    # * The tar file is well-behaved (e.g. no files extracted outside of destination path)
+    # * The correct tar file was provided
     # * Cache file index and cache contents are already consistent (i.e. no files exclusive to
     #   one or the other)
     if not domainsub_cache:
@@ -277,34 +913,42 @@ def revert_substitution(domainsub_cache, source_tree):
     if not source_tree.exists():
         raise FileNotFoundError(source_tree)
     resolved_tree = source_tree.resolve()
+    if paths is not None:
+        # The file index has normalized POSIX paths
+        paths = frozenset(PurePosixPath(x).as_posix() for x in paths)
 
     cache_index_files = set() # All files in the file index
 
-    with tempfile.TemporaryDirectory(prefix='domsubcache_files',
-                                     dir=str(resolved_tree)) as tmp_extract_name:
-        extract_path = Path(tmp_extract_name)
-        get_logger().debug('Extracting domain substitution cache...')
-        extract_tar_file(domainsub_cache, extract_path, None)
+    with tarfile.open(str(domainsub_cache), 'r') as cache_tar:
+        get_logger().debug('Reading domain substitution cache members...')
+        cache_members, reverted_files, index_content = _read_cache_members(cache_tar)
 
         # Validate source tree file hashes match
         get_logger().debug('Validating substituted files in source tree...')
-        with (extract_path / _INDEX_LIST).open('rb') as index_file: #pylint: disable=no-member
-            if not _validate_file_index(index_file, resolved_tree, cache_index_files):
-                raise KeyError('Domain substitution cache file index is corrupt or hashes mismatch '
-                               'the source tree.')
-
-        # Move original files over substituted ones
-        get_logger().debug('Moving original files over substituted ones...')
-        for relative_path in cache_index_files:
-            with _update_timestamp(resolved_tree / relative_path, set_new=False):
-                (extract_path / _ORIG_DIR / relative_path).replace(resolved_tree / relative_path)
-
-        # Quick check for unused files in cache
-        orig_has_unused = False
-        for orig_path in (extract_path / _ORIG_DIR).rglob('*'): #pylint: disable=no-member
-            if orig_path.is_file():
-                get_logger().warning('Unused file from cache: %s', orig_path)
-                orig_has_unused = True
+        if not _validate_file_index(io.BytesIO(index_content), resolved_tree, cache_index_files,
+                                    jobs, paths):
+            raise KeyError('Domain substitution cache file index is corrupt or hashes mismatch '
+                           'the source tree.')
+        orig_members = tuple((x, _pop_orig_member(cache_members, x)) for x in cache_index_files)
+
+        get_logger().debug('Writing original files over substituted ones...')
+        _write_orig_files(cache_tar, orig_members, resolved_tree)
+
+    if paths is not None:
+        if any(member.isfile() for member in cache_members.values()):
+            get_logger().debug('Removing reverted files from the cache file index...')
+            _remove_reverted_files(domainsub_cache, index_content,
+                                   reverted_files | cache_index_files)
+        else:
+            domainsub_cache.unlink()
+        return
+
+    # Quick check for unused files in cache
+    orig_has_unused = False
+    for member_name, member in cache_members.items():
+        if member.isfile():
+            get_logger().warning('Unused file from cache: %s', member_name)
+            orig_has_unused = True
 
     if orig_has_unused:
         get_logger().warning('Cache contains unused files. Not removing.')
@@ -312,12 +956,100 @@ def revert_substitution(domainsub_cache, source_tree):
         domainsub_cache.unlink()
 
 
+def _report_content(original_content, regex_list, pattern_matches, pattern_seconds):
+    """
+    Substitutes the raw content of a file in memory, and adds the number of matches and
+        the time spent for each regex to the collections.Counter pattern_matches
+        and pattern_seconds, keyed by the index of the regex.
+
+    Raises UnicodeDecodeError if the content cannot be decoded.
+    """
+    content, _, regex_iter = _decode_content(original_content, regex_list.regex_pairs,
+                                             regex_list.bytes_regex_pairs)
+    for pattern_index, regex_pair in enumerate(regex_iter):
+        pattern_start = time.perf_counter()
+        if regex_pair.literal is None or regex_pair.literal in content:
+            content, sub_count = regex_pair.pattern.subn(regex_pair.replacement, content)
+            pattern_matches[pattern_index] += sub_count
+        pattern_seconds[pattern_index] += time.perf_counter() - pattern_start
+
+
+def report_substitution(regex_path, files_path, source_tree, slowest_count=10):
+    """
+    Measures domain substitution on source_tree without modifying any files.
+        The regexes are applied in the same way as apply_substitution()
+
+    regex_path is a pathlib.Path to domain_regex.list
+    files_path is a pathlib.Path to domain_substitution.list
+    source_tree is a pathlib.Path to the source tree.
+    slowest_count is the number of slowest files to report.
+
+    Returns a tuple of:
+        * A tuple of (pattern, number of matches, seconds) for each regex
+        * The number of files scanned
+        * The number of bytes scanned
+        * A list of (seconds, relative path) for the slowest files, slowest first
+
+    Raises FileNotFoundError if the source tree or required files do not exist.
+    """
+    if not source_tree.exists():
+        raise FileNotFoundError(source_tree)
+    if not regex_path.exists():
+        raise FileNotFoundError(regex_path)
+    if not files_path.exists():
+        raise FileNotFoundError(files_path)
+    source_tree = source_tree.resolve()
+    regex_list = DomainRegexList(regex_path)
+    pattern_matches = collections.Counter()
+    pattern_seconds = collections.Counter()
+    file_seconds = []
+    bytes_scanned = 0
+    for relative_path in _read_files_list(files_path):
+        path = source_tree / relative_path
+        if not path.is_file() or path.is_symlink():
+            get_logger().warning('Skipping path that is not a regular file: %s', path)
+            continue
+        original_content = path.read_bytes()
+        bytes_scanned += len(original_content)
+        file_start = time.perf_counter()
+        if original_content:
+            _report_content(original_content, regex_list, pattern_matches, pattern_seconds)
+        file_seconds.append((time.perf_counter() - file_start, relative_path))
+    pattern_stats = tuple(
+        (regex_pair.pattern.pattern, pattern_matches[pattern_index], pattern_seconds[pattern_index])
+        for pattern_index, regex_pair in enumerate(regex_list.regex_pairs))
+    slowest_files = heapq.nlargest(slowest_count, file_seconds)
+    return pattern_stats, len(file_seconds), bytes_scanned, slowest_files
+
+
 def _callback(args):
     """CLI Callback"""
     if args.reverting:
-        revert_substitution(args.cache, args.directory)
+        paths = None
+        if args.paths or args.from_list:
+            paths = set(args.paths or ())
+            if args.from_list:
+                paths.update(filter(len, args.from_list.read_text(encoding=ENCODING).splitlines()))
+        revert_substitution(args.cache, args.directory, args.jobs, paths)
     else:
-        apply_substitution(args.regex, args.files, args.directory, args.cache)
+        apply_substitution(args.regex, args.files, args.directory, args.cache, args.jobs,
+                           args.index)
+
+
+def _report_callback(args):
+    """CLI Callback for report"""
+    pattern_stats, files_scanned, bytes_scanned, slowest_files = report_substitution(
+        args.regex, args.files, args.directory, args.slowest)
+    pattern_width = max(len(pattern) for pattern, _, _ in pattern_stats)
+    print(f'{"Pattern":<{pattern_width}}  {"Matches":>10}  {"Seconds":>10}')
+    for pattern, matches, seconds in pattern_stats:
+        print(f'{pattern:<{pattern_width}}  {matches:>10,d}  {seconds:>10.3f}')
+    total_seconds = sum(seconds for _, _, seconds in pattern_stats)
+    print(f'Scanned {files_scanned:,d} files ({bytes_scanned:,d} B) '
+          f'with {total_seconds:.3f} seconds in regexes')
+    print('Slowest files:')
+    for seconds, relative_path in slowest_files:
+        print(f'{seconds:>10.3f}  {relative_path}')
 
 
 def main():
@@ -346,7 +1078,21 @@ def main():
         '-c',
         '--cache',
         type=Path,
-        help='The path to the domain substitution cache. The path must not already exist.')
+        help=('The path to the domain substitution cache. The path must not already exist. '
+              'The cache is compressed if the path ends with .gz, .bz2 or .xz.'))
+    apply_parser.add_argument('-j',
+                              '--jobs',
+                              type=int,
+                              default=1,
+                              help=('The number of worker processes to substitute files with. '
+                                    'Default: %(default)s'))
+    apply_parser.add_argument(
+        '-i',
+        '--index',
+        type=Path,
+        help=('The path to a directory for the incremental substitution index. '
+              'It records file content hashes so that unchanged files are not substituted '
+              'again on later runs. It is created if it does not exist.'))
     apply_parser.add_argument('directory',
                               type=Path,
                               help='The directory to apply domain substitution')
@@ -366,8 +1112,49 @@ def main():
                                required=True,
                                help=('The path to the domain substitution cache. '
                                      'The path must exist and will be removed if successful.'))
+    revert_parser.add_argument('-j',
+                               '--jobs',
+                               type=int,
+                               default=1,
+                               help=('The number of threads to validate the hashes of '
+                                     'substituted files with. Default: %(default)s'))
+    revert_parser.add_argument(
+        '--paths',
+        nargs='+',
+        metavar='PATH',
+        help=('Revert only these files, relative to the directory. They are removed from the '
+              'cache, which is kept until all files have been reverted.'))
+    revert_parser.add_argument('--from-list',
+                               type=Path,
+                               metavar='LIST',
+                               help=('Revert only the files listed in this file, one per line. '
+                                     'Can be combined with --paths.'))
     revert_parser.set_defaults(reverting=True)
 
+    # report
+    report_parser = subparsers.add_parser(
+        'report',
+        help='Report the cost of domain substitution',
+        description=('Runs domain substitution without modifying any files, and reports the '
+                     'matches and time spent for each pattern and the slowest files.'))
+    report_parser.add_argument('-r',
+                               '--regex',
+                               type=Path,
+                               required=True,
+                               help='Path to domain_regex.list')
+    report_parser.add_argument('-f',
+                               '--files',
+                               type=Path,
+                               required=True,
+                               help='Path to domain_substitution.list')
+    report_parser.add_argument('--slowest',
+                               type=int,
+                               default=10,
+                               metavar='NUM',
+                               help='The number of slowest files to report. Default: %(default)s')
+    report_parser.add_argument('directory', type=Path, help='The directory to measure')
+    report_parser.set_defaults(callback=_report_callback)
+
     args = parser.parse_args()
     args.callback(args)
 
@@ -7,20 +7,31 @@
 """
 Module for the downloading, checking, and unpacking of necessary files into the source tree.
 """
+# pylint: disable=too-many-lines
 
 import argparse
+import concurrent.futures
 import configparser
+import contextlib
 import enum
+import functools
 import hashlib
+import json
+import math
+import os
+import re
 import shutil
 import ssl
 import subprocess
 import sys
+import threading
+import urllib.error
 import urllib.request
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 from _common import ENCODING, USE_REGISTRY, ExtractorEnum, PlatformEnum, \
-    get_logger, get_chromium_version, get_running_platform, add_common_params
+    get_logger, get_chromium_version, get_running_platform, add_common_params, lock_file
+from _download_store import DownloadStore
 from _extraction import extract_tar_file, extract_with_7z, extract_with_winrar
 
 sys.path.insert(0, str(Path(__file__).parent / 'third_party'))
@@ -30,6 +41,24 @@ sys.path.pop(0)
 
 # Constants
 
+# Seconds between updates of the progress of concurrent downloads
+_PROGRESS_INTERVAL = 0.5
+
+# Size of the HTTP range requests of segmented downloads. Smaller files are not segmented.
+_SEGMENT_BYTES = 16 * 1024 * 1024
+_SEGMENT_READ_BYTES = 1024 * 1024
+# Seconds to wait for a connection or data before a segment fails
+_SEGMENT_TIMEOUT = 60
+
+# Hash algorithms that can identify downloads in the download store, in order of preference
+_STORE_HASHES = ('sha512', 'sha256')
+
+# File name of the _StampDatabase in the downloads cache
+_STAMP_DATABASE_NAME = 'verified_downloads.json'
+
+# Suffixes of sizes for --store-max-size
+_SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
 
 class HashesURLEnum(str, enum.Enum):
     """Enum for supported hash URL schemes"""
@@ -193,33 +222,323 @@ class _UrlRetrieveReportHook: #pylint: disable=too-few-public-methods
         print('\r' + status_line, end='')
 
 
-def _download_via_urllib(url, file_path, show_progress, disable_ssl_verification):
-    reporthook = None
-    if show_progress:
-        reporthook = _UrlRetrieveReportHook()
-    if disable_ssl_verification:
-        # TODO: Remove this or properly implement disabling SSL certificate verification
-        orig_https_context = ssl._create_default_https_context #pylint: disable=protected-access
-        ssl._create_default_https_context = ssl._create_unverified_context #pylint: disable=protected-access
+class _AggregateProgress:
+    """Prints the combined progress of concurrent downloads to the console"""
+
+    def __init__(self, file_paths, download_count):
+        self._file_paths = file_paths
+        self._download_count = download_count
+        self._finished_count = 0
+        self._max_len_printed = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _downloaded_bytes(self):
+        """Returns the size of the downloaded files and partially downloaded files"""
+        downloaded_bytes = 0
+        for file_path in self._file_paths:
+            for path in (file_path, file_path.with_name(file_path.name + '.partial')):
+                try:
+                    downloaded_bytes += path.stat().st_size
+                    break
+                except FileNotFoundError:
+                    pass
+        return downloaded_bytes
+
+    def _print_status(self):
+        status_line = (f'Progress: {self._finished_count} of {self._download_count} downloads, '
+                       f'{self._downloaded_bytes():,d} B')
+        print('\r' + ' ' * self._max_len_printed, end='')
+        self._max_len_printed = len(status_line)
+        print('\r' + status_line, end='', flush=True)
+
+    def _run(self):
+        while not self._stopped.wait(_PROGRESS_INTERVAL):
+            self._print_status()
+
+    def download_finished(self):
+        """Counts a finished download"""
+        self._finished_count += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._thread.join()
+        self._print_status()
+        print()
+
+
+# State of _unverified_ssl_context() shared by concurrent downloads
+_SSL_CONTEXT_LOCK = threading.Lock()
+_SSL_CONTEXT_STATE = {'users': 0, 'default_context': None}
+
+
+@contextlib.contextmanager
+def _unverified_ssl_context():
+    """
+    Context manager that disables HTTPS certificate verification for urllib.
+
+    The default context is restored once all concurrent downloads using this are finished.
+    """
+    # TODO: Remove this or properly implement disabling SSL certificate verification
+    with _SSL_CONTEXT_LOCK:
+        if _SSL_CONTEXT_STATE['users'] == 0:
+            _SSL_CONTEXT_STATE['default_context'] = ssl._create_default_https_context #pylint: disable=protected-access
+            ssl._create_default_https_context = ssl._create_unverified_context #pylint: disable=protected-access
+        _SSL_CONTEXT_STATE['users'] += 1
     try:
-        urllib.request.urlretrieve(url, str(file_path), reporthook=reporthook)
+        yield
     finally:
         # Try to reduce damage of hack by reverting original HTTPS context ASAP
-        if disable_ssl_verification:
-            ssl._create_default_https_context = orig_https_context #pylint: disable=protected-access
+        with _SSL_CONTEXT_LOCK:
+            _SSL_CONTEXT_STATE['users'] -= 1
+            if _SSL_CONTEXT_STATE['users'] == 0:
+                ssl._create_default_https_context = _SSL_CONTEXT_STATE['default_context'] #pylint: disable=protected-access
+
+
+def _hash_file(file_path, hashers, chunk_bytes=262144):
+    """Updates every hasher in the iterable hashers with the content of file_path in one pass"""
+    hashers = tuple(hashers)
+    # Every hasher is updated from the same buffer. hashlib releases the GIL while hashing
+    # large buffers, so files can be hashed concurrently by threads.
+    buffer = bytearray(chunk_bytes)
+    buffer_view = memoryview(buffer)
+    with file_path.open('rb', buffering=0) as file_obj:
+        # Read file in chunks. Default is 262144 bytes.
+        read_bytes = file_obj.readinto(buffer)
+        while read_bytes:
+            for hasher in hashers:
+                hasher.update(buffer_view[:read_bytes])
+            read_bytes = file_obj.readinto(buffer)
+
+
+def _copy_hashed(source_file, destination_file, hashers, reporthook=None, total_size=-1):
+    """
+    Copies source_file to destination_file while updating every hasher in the iterable
+    hashers with the content.
+
+    reporthook is a _UrlRetrieveReportHook to report the progress to with total_size, or None.
+
+    Returns the number of bytes copied.
+    """
+    hashers = tuple(hashers)
+    copied_bytes = 0
+    chunk = source_file.read(_SEGMENT_READ_BYTES)
+    while chunk:
+        destination_file.write(chunk)
+        for hasher in hashers:
+            hasher.update(chunk)
+        copied_bytes += len(chunk)
+        if reporthook is not None:
+            reporthook(copied_bytes, 1, total_size)
+        chunk = source_file.read(_SEGMENT_READ_BYTES)
+    return copied_bytes
+
+
+def _download_via_urllib(url, file_path, show_progress, disable_ssl_verification, hashers):
+    reporthook = None
+    if show_progress:
+        reporthook = _UrlRetrieveReportHook()
+    with _unverified_ssl_context() if disable_ssl_verification else contextlib.nullcontext(), \
+            urllib.request.urlopen(url) as response, file_path.open('wb') as file_obj:
+        total_size = int(response.headers.get('Content-Length', -1))
+        copied_bytes = _copy_hashed(response, file_obj, hashers, reporthook, total_size)
     if show_progress:
         print()
+    if copied_bytes < total_size:
+        raise urllib.error.ContentTooShortError(
+            f'retrieval incomplete: got only {copied_bytes} out of {total_size} bytes', None)
+
+
+def _download_via_curl(url, file_path, show_progress, hashers):
+    # The existing content of a resumed download is hashed before the rest is appended
+    resume_offset = file_path.stat().st_size if file_path.exists() else 0
+    if resume_offset:
+        _hash_file(file_path, hashers)
+    cmd = ['curl', '-fL', '-C', str(resume_offset), url]
+    if not show_progress:
+        cmd.append('-sS')
+    with file_path.open('ab') as file_obj, subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+        _copy_hashed(proc.stdout, file_obj, hashers)
+    if proc.returncode != 0:
+        get_logger().error('curl failed. Re-run the download command to resume downloading.')
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+class _SegmentedDownload: #pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Downloads a file with concurrent HTTP range requests into a preallocated .partial file.
 
+    The finished segments are recorded in a segment map next to the .partial file, so that
+    resuming the download only requests the missing segments.
+    """
 
-def _download_if_needed(file_path, url, show_progress, disable_ssl_verification):
+    def __init__(self, url, tmp_file_path, show_progress, disable_ssl_verification):
+        self._url = url
+        self._tmp_file_path = tmp_file_path
+        self._map_path = tmp_file_path.with_name(tmp_file_path.name + '.segments')
+        self._ssl_context = None
+        if disable_ssl_verification:
+            self._ssl_context = ssl._create_unverified_context() #pylint: disable=protected-access
+        self._reporthook = _UrlRetrieveReportHook() if show_progress else None
+        self._lock = threading.Lock()
+        self._size = None
+        self._finished_segments = set()
+        self._downloaded_bytes = 0
+        # Set when a segment failed, so that the other segments stop
+        self._stopped = threading.Event()
+
+    def _open_range(self, url, start, end):
+        """Returns the response to a request of the bytes from start to end inclusive"""
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start}-{end}'})
+        return urllib.request.urlopen( #pylint: disable=consider-using-with
+            request,
+            timeout=_SEGMENT_TIMEOUT,
+            context=self._ssl_context)
+
+    def _probe(self):
+        """
+        Returns the URL after redirects and the size of the file, or None if the server
+        does not support range requests.
+        """
+        with self._open_range(self._url, 0, 0) as response:
+            content_range = re.fullmatch(r'bytes 0-0/(\d+)',
+                                         response.headers.get('Content-Range', ''))
+            if response.status != 206 or content_range is None:
+                return None
+            return response.geturl(), int(content_range.group(1))
+
+    def _segment_range(self, segment):
+        """Returns the (start, end) inclusive byte range of segment"""
+        start = segment * _SEGMENT_BYTES
+        return start, min(start + _SEGMENT_BYTES, self._size) - 1
+
+    def _load_map(self):
+        """Loads the finished segments if the segment map is for the same file"""
+        if not self._tmp_file_path.exists() or not self._map_path.exists():
+            return
+        segment_map = json.loads(self._map_path.read_text(encoding=ENCODING))
+        if segment_map.get('size') == self._size and segment_map.get(
+                'segment_bytes') == _SEGMENT_BYTES:
+            self._finished_segments.update(segment_map['finished'])
+
+    def _save_map(self):
+        """Atomically writes the segment map. The lock must be held."""
+        map_tmp_path = self._map_path.with_name(self._map_path.name + '.tmp')
+        map_tmp_path.write_text(json.dumps({
+            'size': self._size,
+            'segment_bytes': _SEGMENT_BYTES,
+            'finished': sorted(self._finished_segments),
+        }),
+                                encoding=ENCODING)
+        os.replace(map_tmp_path, self._map_path)
+
+    def _update_progress(self, byte_count):
+        with self._lock:
+            self._downloaded_bytes += byte_count
+            if self._reporthook is not None:
+                self._reporthook(self._downloaded_bytes, 1, self._size)
+
+    def _download_segment(self, url, segment):
+        """
+        Downloads segment into the .partial file and records it in the segment map.
+        Returns early without recording it if the download was stopped.
+        """
+        if self._stopped.is_set():
+            return
+        start, end = self._segment_range(segment)
+        with self._open_range(url, start, end) as response, \
+                self._tmp_file_path.open('r+b') as tmp_file:
+            if response.headers.get('Content-Range', '').split('/')[0] != f'bytes {start}-{end}':
+                raise urllib.error.URLError(f'Unexpected response to range request: {url}')
+            tmp_file.seek(start)
+            position = start
+            while position <= end:
+                if self._stopped.is_set():
+                    return
+                chunk = response.read(min(_SEGMENT_READ_BYTES, end + 1 - position))
+                if not chunk:
+                    raise urllib.error.ContentTooShortError(
+                        f'Segment {segment} ended at byte {position} instead of {end}', None)
+                tmp_file.write(chunk)
+                position += len(chunk)
+                self._update_progress(len(chunk))
+        with self._lock:
+            self._finished_segments.add(segment)
+            self._save_map()
+
+    def run(self, connections):
+        """
+        Downloads the file with up to connections concurrent requests.
+
+        Returns False without downloading if the server does not support range requests,
+        or if the file is too small to be segmented.
+        """
+        probe_result = self._probe()
+        if probe_result is None:
+            get_logger().debug('Server does not support range requests: %s', self._url)
+            return False
+        url, self._size = probe_result
+        segment_count = math.ceil(self._size / _SEGMENT_BYTES)
+        if segment_count < 2:
+            return False
+        self._load_map()
+        if not self._finished_segments:
+            # Preallocate the file, so that segments can be written in any order
+            with self._tmp_file_path.open('wb') as tmp_file:
+                tmp_file.truncate(self._size)
+            with self._lock:
+                self._save_map()
+        missing_segments = sorted(set(range(segment_count)) - self._finished_segments)
+        get_logger().debug('Downloading %s of %s segments with %s connections',
+                           len(missing_segments), segment_count, connections)
+        self._downloaded_bytes = sum(
+            self._segment_range(segment)[1] + 1 - self._segment_range(segment)[0]
+            for segment in self._finished_segments)
+        with concurrent.futures.ThreadPoolExecutor(connections) as executor:
+            futures = [
+                executor.submit(self._download_segment, url, segment)
+                for segment in missing_segments
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except BaseException:
+                # Do not wait for the other segments to finish
+                self._stopped.set()
+                for future in futures:
+                    future.cancel()
+                raise
+        if self._reporthook is not None:
+            print()
+        self._map_path.unlink()
+        return True
+
+
+def _download_if_needed( #pylint: disable=too-many-arguments
+    file_path,
+    url,
+    show_progress,
+    disable_ssl_verification,
+    segments=1,
+    hash_names=()):
     """
     Downloads a file from url to the specified path file_path if necessary.
 
     If show_progress is True, download progress is printed to the console.
+    If segments is greater than 1, large files are downloaded with up to segments concurrent
+    HTTP range requests if the server supports them.
+    hash_names is an iterable of hash algorithms to compute while downloading.
+
+    Returns a dictionary of hash algorithm to hex digest of the downloaded file, or None if
+    the file was not downloaded or the hashes could not be computed while downloading.
     """
     if file_path.exists():
         get_logger().info('%s already exists. Skipping download.', file_path)
-        return
+        return None
 
     # File name for partially download file
     tmp_file_path = file_path.with_name(file_path.name + '.partial')
@@ -230,19 +549,31 @@ def _download_if_needed(file_path, url, show_progress, disable_ssl_verification)
         get_logger().debug('Downloading URL %s ...', url)
 
     # Perform download
+    segment_map_path = tmp_file_path.with_name(tmp_file_path.name + '.segments')
+    if segments > 1 and (segment_map_path.exists() or not tmp_file_path.exists()):
+        get_logger().debug('Trying segmented download')
+        if _SegmentedDownload(url, tmp_file_path, show_progress,
+                              disable_ssl_verification).run(segments):
+            tmp_file_path.rename(file_path)
+            # Segments are not downloaded in order, so they cannot be hashed while downloading
+            return None
+    if segment_map_path.exists():
+        # The preallocated file of a segmented download cannot be resumed sequentially
+        get_logger().debug('Discarding segmented partial download')
+        tmp_file_path.unlink(missing_ok=True)
+        segment_map_path.unlink()
+    hashers = {hash_name: hashlib.new(hash_name) for hash_name in hash_names}
     if shutil.which('curl'):
         get_logger().debug('Using curl')
-        try:
-            subprocess.run(['curl', '-fL', '-o', str(tmp_file_path), '-C', '-', url], check=True)
-        except subprocess.CalledProcessError as exc:
-            get_logger().error('curl failed. Re-run the download command to resume downloading.')
-            raise exc
+        _download_via_curl(url, tmp_file_path, show_progress, hashers.values())
     else:
         get_logger().debug('Using urllib')
-        _download_via_urllib(url, tmp_file_path, show_progress, disable_ssl_verification)
+        _download_via_urllib(url, tmp_file_path, show_progress, disable_ssl_verification,
+                             hashers.values())
 
     # Download complete; rename file
     tmp_file_path.rename(file_path)
+    return {hash_name: hasher.hexdigest() for hash_name, hasher in hashers.items()}
 
 
 def _chromium_hashes_generator(hashes_path):
@@ -268,11 +599,138 @@ def _get_hash_pairs(download_properties, cache_dir):
             yield entry_type, entry_value
 
 
-def retrieve_downloads(download_info,
-                       cache_dir,
-                       components,
-                       show_progress,
-                       disable_ssl_verification=False):
+def _retrieve_download(download_properties, cache_dir, download_kwargs):
+    """
+    Retrieves the download and its hash URL file into the downloads cache.
+
+    download_kwargs is a dictionary of keyword arguments for _download_if_needed()
+
+    Returns the dictionary of hash algorithm to hex digest computed while downloading, or None.
+    """
+    # The hash URL file is retrieved first so that the download can be hashed while downloading
+    if download_properties.has_hash_url():
+        _, hash_filename, hash_url = download_properties.hashes['hash_url']
+        _download_if_needed(cache_dir / hash_filename, hash_url, **download_kwargs)
+    download_path = cache_dir / download_properties.download_filename
+    return _download_if_needed(
+        download_path,
+        download_properties.url,
+        hash_names={hash_name
+                    for hash_name, _ in _get_hash_pairs(download_properties, cache_dir)},
+        **download_kwargs)
+
+
+def _store_key(download_properties):
+    """
+    Returns the key of the download in the download store, or None if it has no hash
+    that can identify it.
+    """
+    hashes = download_properties.hashes
+    for hash_name in _STORE_HASHES:
+        if hash_name in hashes:
+            return f'{hash_name}-{hashes[hash_name].lower()}'
+    if 'hash_url' in hashes:
+        hash_url_digest = hashlib.sha256(
+            DownloadInfo.hash_url_delimiter.join(hashes['hash_url']).encode(ENCODING))
+        return f'hash_url-{hash_url_digest.hexdigest()}'
+    return None
+
+
+def _retrieve_and_check( #pylint: disable=too-many-arguments
+        download_name,
+        download_properties,
+        cache_dir,
+        download_kwargs,
+        stamps,
+        store=None):
+    """
+    Retrieves the download, and checks it if stamps is a _StampDatabase.
+
+    If store is a DownloadStore, the download is materialized from the store if possible,
+    and added to the store once it is checked. If a materialized download fails the check,
+    it is removed from the store and downloaded again.
+    """
+    download_path = cache_dir / download_properties.download_filename
+    store_key = None if store is None else _store_key(download_properties)
+    materialized = (store_key is not None and not download_path.exists()
+                    and store.materialize(store_key, download_path))
+    if not materialized:
+        get_logger().info('Downloading "%s" to "%s" ...', download_name,
+                          download_properties.download_filename)
+    digests = _retrieve_download(download_properties, cache_dir, download_kwargs)
+    if stamps is None:
+        return
+    try:
+        _check_download(download_name,
+                        download_properties,
+                        cache_dir,
+                        digests=digests,
+                        stamps=stamps)
+    except HashMismatchError:
+        if not materialized:
+            raise
+        get_logger().warning('Removing "%s" from the download store since it is corrupt',
+                             download_name)
+        store.remove(store_key)
+        download_path.unlink()
+        get_logger().info('Downloading "%s" to "%s" ...', download_name,
+                          download_properties.download_filename)
+        digests = _retrieve_download(download_properties, cache_dir, download_kwargs)
+        _check_download(download_name,
+                        download_properties,
+                        cache_dir,
+                        digests=digests,
+                        stamps=stamps)
+    if store_key is not None:
+        store.add(store_key, download_path)
+
+
+def _retrieve_concurrently( #pylint: disable=too-many-arguments
+        downloads,
+        cache_dir,
+        download_kwargs,
+        stamps,
+        jobs,
+        store=None):
+    """
+    Retrieves and checks downloads with jobs threads, and prints their combined progress
+    instead of the progress of each download.
+    """
+    file_paths = []
+    for _, download_properties in downloads:
+        file_paths.append(cache_dir / download_properties.download_filename)
+        if download_properties.has_hash_url():
+            file_paths.append(cache_dir / download_properties.hashes['hash_url'][1])
+    with (_AggregateProgress(file_paths, len(downloads)) if download_kwargs['show_progress'] else
+          contextlib.nullcontext()) as progress, \
+            concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(_retrieve_and_check, download_name, download_properties, cache_dir, {
+                **download_kwargs, 'show_progress': False
+            }, stamps, store) for download_name, download_properties in downloads
+        ]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                if progress is not None:
+                    progress.download_finished()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def retrieve_downloads( #pylint: disable=too-many-arguments
+        download_info,
+        cache_dir,
+        components,
+        show_progress,
+        disable_ssl_verification=False,
+        jobs=1,
+        verify=False,
+        segments=1,
+        store=None,
+        force_verify=False):
     """
     Retrieve downloads into the downloads cache.
 
@@ -282,30 +740,158 @@ def retrieve_downloads(download_info,
     show_progress is a boolean indicating if download progress is printed to the console.
     disable_ssl_verification is a boolean indicating if certificate verification
         should be disabled for downloads using HTTPS.
+    jobs is the number of downloads to retrieve concurrently. If it is greater than 1,
+        the combined progress of all downloads is printed instead.
+    verify is a boolean indicating if each download is checked like with check_downloads()
+        as soon as it is retrieved.
+    segments is the maximum number of concurrent HTTP range requests for each large file.
+        If it is 1, files are downloaded with curl or urllib.
+    store is a DownloadStore to materialize downloads from instead of downloading them,
+        or None. Downloads are added to it after they are checked, so it requires verify.
+    force_verify is a boolean indicating if downloads are read to check them even if they
+        were verified before and are unchanged since.
 
     Raises FileNotFoundError if the downloads path does not exist.
     Raises NotADirectoryError if the downloads path is not a directory.
+    Raises HashMismatchError if verify is True and the computed and expected hashes
+        of a download do not match.
     """
     if not cache_dir.exists():
         raise FileNotFoundError(cache_dir)
     if not cache_dir.is_dir():
         raise NotADirectoryError(cache_dir)
-    for download_name, download_properties in download_info.properties_iter():
-        if components and not download_name in components:
-            continue
-        get_logger().info('Downloading "%s" to "%s" ...', download_name,
-                          download_properties.download_filename)
-        download_path = cache_dir / download_properties.download_filename
-        _download_if_needed(download_path, download_properties.url, show_progress,
-                            disable_ssl_verification)
-        if download_properties.has_hash_url():
-            get_logger().info('Downloading hashes for "%s"', download_name)
-            _, hash_filename, hash_url = download_properties.hashes['hash_url']
-            _download_if_needed(cache_dir / hash_filename, hash_url, show_progress,
-                                disable_ssl_verification)
+    downloads = [(download_name, download_properties)
+                 for download_name, download_properties in download_info.properties_iter()
+                 if not components or download_name in components]
+    download_kwargs = {
+        'show_progress': show_progress,
+        'disable_ssl_verification': disable_ssl_verification,
+        'segments': segments,
+    }
+    stamps = _StampDatabase(cache_dir, force_verify) if verify else None
+    if jobs > 1:
+        _retrieve_concurrently(downloads, cache_dir, download_kwargs, stamps, jobs, store)
+        return
+    for download_name, download_properties in downloads:
+        _retrieve_and_check(download_name, download_properties, cache_dir, download_kwargs, stamps,
+                            store)
+
+
+class _StampDatabase:
+    """
+    Database in the downloads cache of the digests of downloads that passed verification.
+
+    The digests of a download are only used while its size, modification time and inode
+    are the same as when it was verified, so unchanged downloads are not read again.
+    """
+
+    def __init__(self, cache_dir, force_verify=False):
+        """
+        cache_dir is the pathlib.Path to the downloads cache.
+        force_verify is a boolean indicating if recorded digests are ignored.
+        """
+        self._database_path = cache_dir / _STAMP_DATABASE_NAME
+        self._force_verify = force_verify
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            return json.loads(self._database_path.read_text(encoding=ENCODING))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _stamp(download_path):
+        stat_result = download_path.stat()
+        return [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]
+
+    def get_digests(self, download_path):
+        """
+        Returns the dictionary of hash algorithm to hex digest recorded for download_path,
+        or None if there is none or the download was modified since.
+        """
+        if self._force_verify:
+            return None
+        entry = self._load().get(download_path.name)
+        if entry is None or entry['stamp'] != self._stamp(download_path):
+            return None
+        return entry['digests']
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Holds the database lock of this process, and a lock on the database lock file
+        while concurrent processes sharing the downloads cache may update the database.
+        """
+        with self._lock, lock_file(
+                self._database_path.with_name(f'.{self._database_path.name}.lock')):
+            yield
+
+    def record(self, download_path, digests):
+        """Records the digests of the verified download_path"""
+        with self._locked():
+            database = self._load()
+            database[download_path.name] = {
+                'stamp': self._stamp(download_path),
+                'digests': digests,
+            }
+            # Write atomically, so that the database is never read partially written
+            tmp_path = self._database_path.with_name(
+                f'.{self._database_path.name}.{os.getpid()}.tmp')
+            tmp_path.write_text(json.dumps(database, indent=1, sort_keys=True), encoding=ENCODING)
+            os.replace(tmp_path, self._database_path)
+
+
+def _check_download( #pylint: disable=too-many-arguments
+        download_name,
+        download_properties,
+        cache_dir,
+        chunk_bytes=262144,
+        digests=None,
+        stamps=None):
+    """
+    Check integrity of a download in the downloads cache.
 
+    digests is a dictionary of hash algorithm to hex digest computed while downloading, or
+        None. The download is only read to compute the digests missing from it.
+    stamps is the _StampDatabase to use the digests of unchanged downloads from and record
+        the digests of verified downloads in, or None.
 
-def check_downloads(download_info, cache_dir, components, chunk_bytes=262144):
+    Raises source_retrieval.HashMismatchError when the computed and expected hashes do not match.
+    """
+    logger = get_logger()
+    logger.info('Verifying hashes for "%s" ...', download_name)
+
+    download_path = cache_dir / download_properties.download_filename
+    hash_pairs = list(_get_hash_pairs(download_properties, cache_dir))
+    digests = dict(digests or {})
+    stamped_digests = None if stamps is None else stamps.get_digests(download_path)
+    if stamped_digests is not None:
+        logger.info('Using the recorded hashes of the unchanged download')
+        digests.update(stamped_digests)
+    hashers = {
+        hash_name: hashlib.new(hash_name)
+        for hash_name, _ in hash_pairs if hash_name not in digests
+    }
+    if hashers:
+        logger.info('Computing %s hashes...', ', '.join(sorted(hashers)))
+        _hash_file(download_path, hashers.values(), chunk_bytes)
+        digests.update((hash_name, hasher.hexdigest()) for hash_name, hasher in hashers.items())
+    for hash_name, hash_hex in hash_pairs:
+        logger.info('Verifying %s hash...', hash_name)
+        if not digests[hash_name].lower() == hash_hex.lower():
+            raise HashMismatchError(download_path)
+    if stamps is not None and digests != stamped_digests:
+        stamps.record(download_path, digests)
+
+
+def check_downloads( #pylint: disable=too-many-arguments
+        download_info,
+        cache_dir,
+        components,
+        chunk_bytes=262144,
+        jobs=1,
+        force_verify=False):
     """
     Check integrity of the downloads cache.
 
@@ -313,30 +899,61 @@ def check_downloads(download_info, cache_dir, components, chunk_bytes=262144):
     cache_dir is the pathlib.Path to the downloads cache.
     chunk_bytes is the size for each chunk which need to read.
     components is a list of component names to check, if not empty.
+    jobs is the number of downloads to check concurrently.
+    force_verify is a boolean indicating if downloads are read even if they were verified
+        before and are unchanged since.
 
     Raises source_retrieval.HashMismatchError when the computed and expected hashes do not match.
     """
-    logger = get_logger()
-    for download_name, download_properties in download_info.properties_iter():
-        if components and not download_name in components:
-            continue
-        get_logger().info('Verifying hashes for "%s" ...', download_name)
+    downloads = [(download_name, download_properties)
+                 for download_name, download_properties in download_info.properties_iter()
+                 if not components or download_name in components]
+    stamps = _StampDatabase(cache_dir, force_verify)
+    with concurrent.futures.ThreadPoolExecutor(max(jobs, 1)) as executor:
+        futures = [
+            executor.submit(_check_download, download_name, download_properties, cache_dir,
+                            chunk_bytes, None, stamps)
+            for download_name, download_properties in downloads
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
-        download_path = cache_dir / download_properties.download_filename
-        for hash_name, hash_hex in _get_hash_pairs(download_properties, cache_dir):
-            logger.info('Verifying %s hash...', hash_name)
-            hasher = hashlib.new(hash_name)
-            with download_path.open('rb') as file_obj:
-                # Read file in chunks. Default is 262144 bytes.
-                chunk = file_obj.read(chunk_bytes)
-                while chunk:
-                    hasher.update(chunk)
-                    chunk = file_obj.read(chunk_bytes)
-            if not hasher.hexdigest().lower() == hash_hex.lower():
-                raise HashMismatchError(download_path)
-
-
-def unpack_downloads(download_info, cache_dir, components, output_dir, extractors=None):
+
+def _component_paths(paths, output_path):
+    """
+    Returns the paths inside the output_path of a component, relative to output_path.
+
+    paths is a set of POSIX paths relative to the output directory, or a dictionary of them
+        to functions that take the path and another argument. A set, or a dictionary of the
+        functions of the other argument, is returned. None is returned if paths is None.
+    """
+    if paths is None:
+        return None
+    output_posix = PurePosixPath(output_path).as_posix()
+    prefix = '' if output_posix == '.' else f'{output_posix}/'
+    component_paths = ((path[len(prefix):], path) for path in paths if path.startswith(prefix))
+    if isinstance(paths, dict):
+        return {
+            relative_path: functools.partial(paths[path], path)
+            for relative_path, path in component_paths
+        }
+    return frozenset(relative_path for relative_path, _ in component_paths)
+
+
+def unpack_downloads( #pylint: disable=too-many-arguments
+        download_info,
+        cache_dir,
+        components,
+        output_dir,
+        extractors=None,
+        prune_list=None,
+        rewrite_paths=None,
+        writers=1):
     """
     Unpack downloads in the downloads cache to output_dir. Assumes all downloads are retrieved.
 
@@ -346,9 +963,19 @@ def unpack_downloads(download_info, cache_dir, components, output_dir, extractor
     output_dir is the pathlib.Path directory to unpack the downloads to.
     extractors is a dictionary of PlatformEnum to a command or path to the
         extractor binary. Defaults to 'tar' for tar, and '_use_registry' for 7-Zip and WinRAR.
+    prune_list is an iterable of POSIX paths relative to output_dir of files that should not
+        be unpacked, like from pruning.list, or None to unpack all files.
+    rewrite_paths is a dictionary of POSIX paths relative to output_dir of files to rewrite
+        while unpacking them from tar archives, or None. The functions take the POSIX path
+        and the raw content of the file, and return the content to write instead.
+        Files unpacked with other extractors are not rewritten.
+    writers is the number of threads that write the files unpacked from tar archives,
+        like for _extraction.extract_tar_file()
 
     May raise undetermined exceptions during archive unpacking.
     """
+    if prune_list is not None:
+        prune_list = frozenset(prune_list)
     for download_name, download_properties in download_info.properties_iter():
         if components and not download_name in components:
             continue
@@ -370,10 +997,18 @@ def unpack_downloads(download_info, cache_dir, components, output_dir, extractor
         else:
             strip_leading_dirs_path = Path(download_properties.strip_leading_dirs)
 
+        extractor_kwargs = {}
+        if extractor_name == ExtractorEnum.TAR:
+            extractor_kwargs['writers'] = writers
+            if rewrite_paths is not None:
+                extractor_kwargs['rewrite_paths'] = _component_paths(
+                    rewrite_paths, download_properties.output_path)
         extractor_func(archive_path=download_path,
                        output_dir=output_dir / Path(download_properties.output_path),
                        relative_to=strip_leading_dirs_path,
-                       extractors=extractors)
+                       extractors=extractors,
+                       skip_paths=_component_paths(prune_list, download_properties.output_path),
+                       **extractor_kwargs)
 
 
 def _add_common_args(parser):
@@ -390,13 +1025,31 @@ def _add_common_args(parser):
                         help='Path to the directory to cache downloads.')
 
 
+def _parse_size(value):
+    """Returns the number of bytes of a size like 500M or 20G"""
+    match = re.fullmatch(r'(\d+)([KMGT]?)', value.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f'Invalid size: {value}')
+    return int(match.group(1)) * _SIZE_SUFFIXES[match.group(2)]
+
+
 def _retrieve_callback(args):
     info = DownloadInfo(args.ini)
     info.check_sections_exist(args.components)
-    retrieve_downloads(info, args.cache, args.components, args.show_progress,
-                       args.disable_ssl_verification)
+    store = None
+    if args.store:
+        store = DownloadStore(args.store, args.store_max_size)
     try:
-        check_downloads(info, args.cache, args.components)
+        retrieve_downloads(info,
+                           args.cache,
+                           args.components,
+                           args.show_progress,
+                           args.disable_ssl_verification,
+                           jobs=args.jobs,
+                           verify=True,
+                           segments=args.segments,
+                           store=store,
+                           force_verify=args.force_verify)
     except HashMismatchError as exc:
         get_logger().error('File checksum does not match: %s', exc)
         sys.exit(1)
@@ -411,9 +1064,18 @@ def _unpack_callback(args):
         ExtractorEnum.WINRAR: args.winrar_path,
         ExtractorEnum.TAR: args.tar_path,
     }
+    prune_list = None
+    if args.pruning_list:
+        prune_list = filter(len, args.pruning_list.read_text(encoding=ENCODING).splitlines())
     info = DownloadInfo(args.ini)
     info.check_sections_exist(args.components)
-    unpack_downloads(info, args.cache, args.components, args.output, extractors)
+    unpack_downloads(info,
+                     args.cache,
+                     args.components,
+                     args.output,
+                     extractors,
+                     prune_list,
+                     writers=args.writers)
 
 
 def main():
@@ -443,6 +1105,41 @@ def main():
         '--disable-ssl-verification',
         action='store_true',
         help='Disables certification verification for downloads using HTTPS.')
+    retrieve_parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        metavar='NUM',
+        help=('The number of downloads to retrieve concurrently. Each download is checked as '
+              'soon as it is retrieved. Default: %(default)s'))
+    retrieve_parser.add_argument(
+        '--segments',
+        type=int,
+        default=1,
+        metavar='NUM',
+        help=('Download large files with up to this many concurrent HTTP range requests '
+              'using Python\'s urllib, if the server supports them. Segmented downloads '
+              'can be resumed. Default: %(default)s'))
+    retrieve_parser.add_argument(
+        '--force-verify',
+        action='store_true',
+        help=('Read all downloads to verify them, even if they were verified before and are '
+              'unchanged since.'))
+    retrieve_parser.add_argument(
+        '--store',
+        type=Path,
+        metavar='DIR',
+        help=('A download store shared by download caches. Downloads in the store are hard '
+              'linked, reflinked or copied into the cache instead of downloaded. Verified '
+              'downloads are added to the store. Only downloads with a sha256, sha512 or '
+              'hash_url are stored.'))
+    retrieve_parser.add_argument(
+        '--store-max-size',
+        type=_parse_size,
+        metavar='SIZE',
+        help=('The maximum size of the download store, like 20G. The least recently used '
+              'downloads are evicted when it is exceeded. Default: no limit'))
     retrieve_parser.set_defaults(callback=_retrieve_callback)
 
     def _default_extractor_path(name):
@@ -474,6 +1171,22 @@ def main():
         default=USE_REGISTRY,
         help=('Command or path to WinRAR\'s "winrar" binary. If "_use_registry" is '
               'specified, determine the path from the registry. Default: %(default)s'))
+    unpack_parser.add_argument(
+        '--pruning-list',
+        type=Path,
+        metavar='PATH',
+        help=('Do not unpack the files in this pruning.list, instead of deleting them with '
+              'prune_binaries.py later. prune_binaries.py must then be run with '
+              '--pruned-on-unpack.'))
+    unpack_parser.add_argument(
+        '--writers',
+        type=int,
+        default=1,
+        metavar='NUM',
+        help=('The number of threads that write the files unpacked from tar archives. If it is '
+              'greater than 1, the pure Python tar extractor is used, which writes files while '
+              'reading the archive. This can be faster on filesystems with a high latency per '
+              'file. Default: %(default)s'))
     unpack_parser.add_argument('output', type=Path, help='The directory to unpack to.')
     unpack_parser.add_argument('--skip-unused', action='store_true', help='Deprecated')
     unpack_parser.add_argument('--sysroot', choices=('amd64', 'i386'), help='Deprecated')
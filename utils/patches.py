@@ -12,7 +12,7 @@ import shutil
 import subprocess
 from pathlib import Path
 
-from _common import get_logger, parse_series, add_common_params
+from _common import LinkModeEnum, get_logger, link_file, parse_series, add_common_params
 
 
 def _find_patch_from_env():
@@ -147,19 +147,35 @@ def generate_patches_from_series(patches_dir, resolve=False):
             yield patch_path
 
 
-def _copy_files(path_iter, source, destination):
-    """Copy files from source to destination with relative paths from path_iter"""
-    for path in path_iter:
-        (destination / path).parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(str(source / path), str(destination / path))
-
+def _copy_files(path_iter, source, destination, link_modes=(LinkModeEnum.COPY, )):
+    """
+    Copy files from source to destination with relative paths from path_iter
 
-def merge_patches(source_iter, destination, prepend=False):
+    link_modes is an iterable of LinkModeEnum to create the files with, like for
+        _common.link_file()
+    """
+    created_dirs = set()
+    for path in path_iter:
+        destination_path = destination / path
+        if destination_path.parent not in created_dirs:
+            destination_path.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(destination_path.parent)
+        try:
+            link_file(source / path, destination_path, link_modes)
+        except FileExistsError:
+            destination_path.unlink()
+            link_file(source / path, destination_path, link_modes)
+
+
+def merge_patches(source_iter, destination, prepend=False, link_modes=(LinkModeEnum.COPY, )):
     """
     Merges GNU quilt-formatted patches directories from sources into destination
 
     destination must not already exist, unless prepend is True. If prepend is True, then
     the source patches will be prepended to the destination.
+    link_modes is an iterable of LinkModeEnum to try in order to create the merged patches.
+        Hard links and reflinks avoid copying the patches, but modifying a hard linked patch
+        in place also modifies the source patch.
     """
     series = []
     known_paths = set()
@@ -178,7 +194,7 @@ def merge_patches(source_iter, destination, prepend=False):
             raise FileExistsError(f'Patches from {source_dir} have conflicting paths '
                                   f'with other sources: {patch_intersection}')
         series.extend(patch_paths)
-        _copy_files(patch_paths, source_dir, destination)
+        _copy_files(patch_paths, source_dir, destination, link_modes)
     if prepend and (destination / 'series').exists():
         series.extend(generate_patches_from_series(destination))
     with (destination / 'series').open('w') as series_file:
@@ -204,8 +220,16 @@ def _apply_callback(args, parser_error):
                       patch_bin_path=patch_bin_path)
 
 
+# Link modes to try in order for each --link choice of the merge command
+_MERGE_LINK_MODES = {
+    LinkModeEnum.HARDLINK.value: (LinkModeEnum.HARDLINK, LinkModeEnum.REFLINK, LinkModeEnum.COPY),
+    LinkModeEnum.REFLINK.value: (LinkModeEnum.REFLINK, LinkModeEnum.COPY),
+    LinkModeEnum.COPY.value: (LinkModeEnum.COPY, ),
+}
+
+
 def _merge_callback(args, _):
-    merge_patches(args.source, args.destination, args.prepend)
+    merge_patches(args.source, args.destination, args.prepend, _MERGE_LINK_MODES[args.link])
 
 
 def main():
@@ -234,6 +258,14 @@ def main():
         action='store_true',
         help=('If "destination" exists, prepend patches from sources into it.'
               ' By default, merging will fail if the destination already exists.'))
+    merge_parser.add_argument(
+        '--link',
+        choices=tuple(_MERGE_LINK_MODES),
+        default=LinkModeEnum.COPY.value,
+        help=('How to create the merged patches. "hardlink" and "reflink" avoid copying the '
+              'patches, and fall back to the next mode if they are not supported. Editing '
+              'hard linked patches in place also edits the source patches. '
+              'Default: %(default)s'))
     merge_parser.add_argument(
         'destination',
         type=Path,
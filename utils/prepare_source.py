@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""
+Prepares the source tree from the downloads cache by reading each archive once.
+
+It is equivalent to running these in order, but files are pruned and domain
+substituted as they are unpacked:
+
+    downloads.py unpack
+    prune_binaries.py
+    patches.py apply
+    domain_substitution.py apply
+
+Files that are modified by the patches, or that are unpacked from archives other
+than tar archives, are domain substituted after the patches are applied, like with
+domain_substitution.py.
+"""
+
+import argparse
+import re
+from pathlib import Path, PurePosixPath
+
+from _common import ENCODING, add_common_params, get_logger
+from domain_substitution import SubstitutionCacheWriter
+from downloads import DownloadInfo, unpack_downloads
+from patches import apply_patches, generate_patches_from_series
+from prune_binaries import prune_dirs
+
+# Prefixes of the lines in unified diffs with the paths of the modified files
+_PATCH_PATH_PREFIXES = ('--- ', '+++ ')
+# Hunk header of unified diffs with the number of lines in the old and new files
+_HUNK_HEADER = re.compile(r'@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+
+def _read_list(list_path):
+    """Returns a list of the non-empty lines in list_path"""
+    return list(filter(len, list_path.read_text(encoding=ENCODING).splitlines()))
+
+
+def _header_paths(patch_file):
+    """
+    Yields the paths in the file headers of the unified diff patch_file.
+
+    Only the header lines right before a hunk are used, and the lines of hunks are skipped,
+        so removed or added lines that look like headers are ignored.
+    """
+    old_lines = new_lines = 0
+    previous_lines = ('', '')
+    for line in patch_file:
+        if old_lines > 0 or new_lines > 0:
+            if line.startswith('-'):
+                old_lines -= 1
+            elif line.startswith('+'):
+                new_lines -= 1
+            elif not line.startswith('\\'):
+                # Context line
+                old_lines -= 1
+                new_lines -= 1
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match is None:
+            previous_lines = (previous_lines[1], line)
+            continue
+        old_lines, new_lines = (int(count or 1) for count in match.groups())
+        if all(map(str.startswith, previous_lines, _PATCH_PATH_PREFIXES)):
+            for header_line in previous_lines:
+                yield header_line[4:].rstrip('\n').split('\t')[0]
+        previous_lines = ('', '')
+
+
+def get_patched_paths(patches_dirs):
+    """
+    Returns a set of the POSIX paths of the files modified by the patches, relative to
+        the source tree.
+
+    patches_dirs is an iterable of pathlib.Path to patches directories in GNU Quilt format
+    """
+    patched_paths = set()
+    for patches_dir in patches_dirs:
+        for patch_path in generate_patches_from_series(patches_dir, resolve=True):
+            with patch_path.open(encoding=ENCODING, errors='surrogateescape') as patch_file:
+                for path in _header_paths(patch_file):
+                    if path != '/dev/null':
+                        # Patches are applied with -p1
+                        patched_paths.add(PurePosixPath(*PurePosixPath(path).parts[1:]).as_posix())
+    return patched_paths
+
+
+def prepare_source( #pylint: disable=too-many-arguments
+        download_info,
+        cache_dir,
+        output_dir,
+        lists,
+        domainsub_cache,
+        patches_dirs=(),
+        sysroot=None,
+        writers=1):
+    """
+    Unpacks, prunes, patches and domain substitutes the source tree.
+
+    download_info is the DownloadInfo of downloads to unpack.
+    cache_dir is the pathlib.Path directory containing the download cache
+    output_dir is the pathlib.Path directory to unpack the downloads to.
+    lists is a tuple of pathlib.Path to pruning.list, domain_regex.list and
+        domain_substitution.list
+    domainsub_cache is a pathlib.Path to the domain substitution cache to create.
+    patches_dirs is an iterable of pathlib.Path to patches directories to apply.
+    sysroot is a string that optionally defines a sysroot to exempt from pruning
+    writers is the number of threads that write the unpacked files.
+
+    Raises FileExistsError if the domain substitution cache already exists.
+    """
+    pruning_list_path, regex_path, files_path = lists
+    patches_dirs = tuple(patches_dirs)
+    substitute_paths = set(_read_list(files_path))
+    with SubstitutionCacheWriter(regex_path, domainsub_cache) as cache_writer:
+        get_logger().info('Unpacking, pruning and domain substituting...')
+        unpack_downloads(download_info,
+                         cache_dir,
+                         None,
+                         output_dir,
+                         prune_list=_read_list(pruning_list_path),
+                         rewrite_paths=dict.fromkeys(
+                             substitute_paths - get_patched_paths(patches_dirs),
+                             cache_writer.substitute_content),
+                         writers=writers)
+        unpacked_paths = cache_writer.finish_unpacked(output_dir)
+        prune_dirs(output_dir, False, sysroot)
+        for patches_dir in patches_dirs:
+            get_logger().info('Applying patches from %s', patches_dir)
+            apply_patches(generate_patches_from_series(patches_dir, resolve=True), output_dir)
+        get_logger().info('Domain substituting the remaining files...')
+        # Includes the files of components that could not be substituted while unpacking
+        cache_writer.substitute_files(sorted(substitute_paths - unpacked_paths), output_dir)
+
+
+def _callback(args):
+    info = DownloadInfo(args.ini)
+    prepare_source(info, args.cache, args.output, (args.pruning_list, args.regex, args.files),
+                   args.domsubcache, args.patches, args.sysroot, args.writers)
+
+
+def main():
+    """CLI Entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '-i',
+        '--ini',
+        type=Path,
+        nargs='+',
+        required=True,
+        help='The downloads INI to parse for downloads. Can be specified multiple times.')
+    parser.add_argument('-c',
+                        '--cache',
+                        type=Path,
+                        required=True,
+                        help='Path to the directory of the retrieved downloads.')
+    parser.add_argument('--pruning-list', type=Path, required=True, help='Path to pruning.list')
+    parser.add_argument('-r', '--regex', type=Path, required=True, help='Path to domain_regex.list')
+    parser.add_argument('-f',
+                        '--files',
+                        type=Path,
+                        required=True,
+                        help='Path to domain_substitution.list')
+    parser.add_argument('--domsubcache',
+                        type=Path,
+                        required=True,
+                        help=('The path to the domain substitution cache. The path must not '
+                              'already exist. The cache is compressed if the path ends with '
+                              '.gz, .bz2 or .xz.'))
+    parser.add_argument('-p',
+                        '--patches',
+                        type=Path,
+                        nargs='+',
+                        default=(),
+                        help='The directories containing patches to apply in GNU quilt format.')
+    parser.add_argument('--sysroot',
+                        choices=('amd64', 'i386'),
+                        help='Skip pruning the sysroot for the specified architecture.')
+    parser.add_argument('--writers',
+                        type=int,
+                        default=1,
+                        metavar='NUM',
+                        help='The number of threads that write the unpacked files. Default: 1')
+    parser.add_argument('output', type=Path, help='The directory to unpack to.')
+    add_common_params(parser)
+    parser.set_defaults(callback=_callback)
+
+    args = parser.parse_args()
+    args.callback(args)
+
+
+if __name__ == '__main__':
+    main()
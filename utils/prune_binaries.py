@@ -7,9 +7,13 @@
 """Prune binaries from the source tree"""
 
 import argparse
+import collections
+import concurrent.futures
+import functools
 import itertools
 import sys
 import os
+import posixpath
 import stat
 from pathlib import Path
 
@@ -154,64 +158,202 @@ KEEP_FILES = (
 # File suffixes that should be excluded when pruning contingent paths.
 KEEP_SUFFIXES = ('.gn', '.gni', '.grd', '.grdp', '.isolate', '.pydeps')
 
+# Key marking the end of a contingent path in PruningMatcher.contingent_trie
+_TRIE_END = None
 
-def prune_files(unpack_root, prune_list):
+# Modes of _prune_tree()
+_PRUNE_ALL = 'all'
+_PRUNE_CONTINGENT = 'contingent'
+
+# Whether files can be deleted relative to an open directory, to avoid resolving
+# the whole path of every file
+_DIR_FD_SUPPORTED = os.unlink in os.supports_dir_fd and os.chmod in os.supports_dir_fd
+
+
+class PruningMatcher:
+    """
+    Classifies paths of the source tree with CONTINGENT_PATHS, KEEP_FILES and KEEP_SUFFIXES
+        in time proportional to the depth of the path.
+    """
+
+    def __init__(self,
+                 contingent_paths=CONTINGENT_PATHS,
+                 keep_files=KEEP_FILES,
+                 keep_suffixes=KEEP_SUFFIXES):
+        # Trie of the path components of contingent_paths.
+        # The node of each contingent path contains the key _TRIE_END.
+        self.contingent_trie = {}
+        for cpath in contingent_paths:
+            node = self.contingent_trie
+            for component in cpath.rstrip('/').split('/'):
+                node = node.setdefault(component, {})
+            node[_TRIE_END] = True
+        self._keep_files = frozenset(keep_files)
+        self._keep_suffixes = frozenset(keep_suffixes)
+
+    def is_contingent(self, relative_path):
+        """
+        Returns True if the POSIX path relative to the source tree is a contingent path
+            or is inside one; False otherwise.
+        """
+        node = self.contingent_trie
+        for component in relative_path.split('/'):
+            node = node.get(component)
+            if node is None:
+                return False
+            if _TRIE_END in node:
+                return True
+        return False
+
+    def is_kept(self, relative_path):
+        """
+        Returns True if the POSIX path relative to the source tree is kept
+            when pruning contingent paths; False otherwise.
+        """
+        return (relative_path in self._keep_files
+                or os.path.splitext(posixpath.basename(relative_path))[1] in self._keep_suffixes)
+
+
+def _unlink_path(name, dir_fd=None):
+    """
+    Deletes the file name, relative to the directory file descriptor dir_fd if it is not None.
+    """
+    try:
+        os.unlink(name, dir_fd=dir_fd)
+    # read-only files can't be deleted on Windows
+    # so remove the flag and try again.
+    except PermissionError:
+        os.chmod(name, stat.S_IWRITE, dir_fd=dir_fd)
+        os.unlink(name, dir_fd=dir_fd)
+
+
+def _prune_directory_files(unpack_root, directory, relative_files):
+    """
+    Delete files in the same directory. Returns a list of unremovable files.
+
+    unpack_root is a pathlib.Path to the directory to be pruned
+    directory is the directory of the files relative to unpack_root.
+    relative_files is a list of the files to be removed, relative to unpack_root.
+    """
+    unremovable_files = []
+    dir_path = os.path.join(unpack_root, directory)
+    if _DIR_FD_SUPPORTED:
+        try:
+            dir_fd = os.open(dir_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+        except (FileNotFoundError, NotADirectoryError):
+            return [Path(relative_file).as_posix() for relative_file in relative_files]
+    else:
+        dir_fd = None
+    try:
+        for relative_file in relative_files:
+            name = posixpath.basename(relative_file)
+            try:
+                if dir_fd is None:
+                    _unlink_path(os.path.join(dir_path, name))
+                else:
+                    _unlink_path(name, dir_fd)
+            except FileNotFoundError:
+                unremovable_files.append(Path(relative_file).as_posix())
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return unremovable_files
+
+
+def prune_files(unpack_root, prune_list, jobs=1):
     """
     Delete files under unpack_root listed in prune_list. Returns an iterable of unremovable files.
 
     unpack_root is a pathlib.Path to the directory to be pruned
     prune_list is an iterable of files to be removed.
+    jobs is the number of threads to delete files with. Files are grouped by directory,
+        and each directory is pruned by a single thread.
     """
-    unremovable_files = set()
+    files_by_directory = collections.defaultdict(list)
     for relative_file in prune_list:
-        file_path = unpack_root / relative_file
-        try:
-            file_path.unlink()
-        # read-only files can't be deleted on Windows
-        # so remove the flag and try again.
-        except PermissionError:
-            os.chmod(file_path, stat.S_IWRITE)
-            file_path.unlink()
-        except FileNotFoundError:
-            unremovable_files.add(Path(relative_file).as_posix())
-    return unremovable_files
+        files_by_directory[posixpath.dirname(relative_file)].append(relative_file)
+    prune_directory = functools.partial(_prune_directory_files, unpack_root)
+    if jobs > 1:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            results = list(
+                executor.map(prune_directory, files_by_directory.keys(),
+                             files_by_directory.values()))
+    else:
+        results = map(prune_directory, files_by_directory.keys(), files_by_directory.values())
+    return set(itertools.chain.from_iterable(results))
 
 
-def _prune_path(path, unpack_root=None):
+def _remove_path(path, remove_function):
     """
-    Delete files and directories in path.
+    Deletes path with remove_function, which is os.unlink or os.rmdir.
+    """
+    try:
+        remove_function(path)
+    # read-only files can't be deleted on Windows
+    # so remove the flag and try again.
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE)
+        remove_function(path)
 
-    path is a pathlib.Path to the directory to be pruned
-    unpack_root is a pathlib.Path to the source tree
+
+def _prune_tree(dir_path, relative_dir, matcher, trie_node, prune_mode=None):
     """
-    for node in sorted(path.rglob('*'), key=lambda l: len(str(l)), reverse=True):
-        if unpack_root is not None and (node.suffix in KEEP_SUFFIXES
-                                        or str(node.relative_to(unpack_root)) in KEEP_FILES):
-            continue
-        if node.is_file() or node.is_symlink():
-            try:
-                node.unlink()
-            except PermissionError:
-                node.chmod(stat.S_IWRITE)
-                node.unlink()
-        elif node.is_dir() and not any(node.iterdir()):
-            try:
-                node.rmdir()
-            except PermissionError:
-                node.chmod(stat.S_IWRITE)
-                node.rmdir()
+    Walks the directory bottom-up, deleting the files and directories that are pruned.
+        Returns True if the directory is empty afterwards; False otherwise.
+
+    dir_path is the path to the directory to walk
+    relative_dir is the POSIX path of the directory relative to the source tree with
+        a trailing slash, or an empty string for the source tree.
+    matcher is the PruningMatcher of the contingent paths to prune
+    trie_node is the node of the directory in matcher.contingent_trie,
+        or None if it has no contingent paths.
+    prune_mode is _PRUNE_ALL if everything in the directory is pruned,
+        _PRUNE_CONTINGENT if everything except KEEP_FILES and KEEP_SUFFIXES is pruned,
+        or None if nothing is pruned.
+    """
+    is_empty = True
+    try:
+        with os.scandir(dir_path) as entry_iter:
+            entries = list(entry_iter)
+    except PermissionError:
+        get_logger().warning('Skipping unreadable directory: %s', dir_path)
+        return False
+    for entry in entries:
+        relative_path = relative_dir + entry.name
+        is_kept = prune_mode == _PRUNE_CONTINGENT and matcher.is_kept(relative_path)
+        child_node = trie_node.get(entry.name) if trie_node else None
+        is_contingent = prune_mode is None and child_node is not None and _TRIE_END in child_node
+        if entry.is_dir(follow_symlinks=False):
+            child_mode = prune_mode
+            if entry.name == '__pycache__':
+                child_mode = _PRUNE_ALL
+            elif is_contingent:
+                child_mode = _PRUNE_CONTINGENT
+            is_child_empty = _prune_tree(entry.path, f'{relative_path}/', matcher, child_node,
+                                         child_mode)
+            if prune_mode is not None and is_child_empty and not is_kept:
+                _remove_path(entry.path, os.rmdir)
+            else:
+                is_empty = False
+        elif (prune_mode is not None and not is_kept) or is_contingent:
+            _remove_path(entry.path, os.unlink)
+        else:
+            is_empty = False
+    return is_empty
 
 
 def prune_dirs(unpack_root, keep_contingent_paths, sysroot):
     """
     Delete all files and directories in pycache and CONTINGENT_PATHS directories.
 
+    The source tree is walked once without following symlinks.
+        The pycache and CONTINGENT_PATHS directories themselves are kept.
+
     unpack_root is a pathlib.Path to the source tree
     keep_contingent_paths is a boolean that determines if the contingent paths should be pruned
     sysroot is a string that optionally defines a sysroot to exempt from pruning
     """
-    for pycache in unpack_root.rglob('__pycache__'):
-        _prune_path(pycache)
+    contingent_paths = []
     if keep_contingent_paths:
         get_logger().info('Keeping Contingent Paths')
     else:
@@ -220,8 +362,11 @@ def prune_dirs(unpack_root, keep_contingent_paths, sysroot):
             if sysroot and f'{sysroot}-sysroot' in cpath:
                 get_logger().info('%s: %s', 'Exempt', cpath)
                 continue
-            get_logger().info('%s: %s', 'Exists' if Path(cpath).exists() else 'Absent', cpath)
-            _prune_path(unpack_root / cpath, unpack_root)
+            get_logger().info('%s: %s', 'Exists' if (unpack_root / cpath).exists() else 'Absent',
+                              cpath)
+            contingent_paths.append(cpath)
+    matcher = PruningMatcher(contingent_paths)
+    _prune_tree(unpack_root, '', matcher, matcher.contingent_trie)
 
 
 def _callback(args):
@@ -231,8 +376,10 @@ def _callback(args):
     if not args.pruning_list.exists():
         get_logger().error('Could not find the pruning list: %s', args.pruning_list)
     prune_dirs(args.directory, args.keep_contingent_paths, args.sysroot)
+    if args.pruned_on_unpack:
+        return
     prune_list = tuple(filter(len, args.pruning_list.read_text(encoding=ENCODING).splitlines()))
-    unremovable_files = prune_files(args.directory, prune_list)
+    unremovable_files = prune_files(args.directory, prune_list, args.jobs)
     if unremovable_files:
         file_list = '\n'.join(f for f in itertools.islice(unremovable_files, 5))
         if len(unremovable_files) > 5:
@@ -256,6 +403,17 @@ def main():
                         choices=('amd64', 'i386'),
                         help=('Skip pruning the sysroot for the specified architecture. '
                               'Not needed when --keep-contingent-paths is used.'))
+    parser.add_argument('--pruned-on-unpack',
+                        action='store_true',
+                        help=('Only prune the contingent paths, because the files in the pruning '
+                              'list were skipped by "downloads.py unpack --pruning-list".'))
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help=('The number of threads to delete files with. More threads help '
+                              'on file systems with slow metadata operations, such as network '
+                              'file systems. Default: %(default)s'))
     add_common_params(parser)
     parser.set_defaults(callback=_callback)
 
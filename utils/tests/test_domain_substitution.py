@@ -4,9 +4,18 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import gzip
+import hashlib
+import io
 import os
+import random
+import tarfile
 import tempfile
+import zlib
 from pathlib import Path
+from unittest import mock
+
+import pytest
 
 from .. import domain_substitution
 
@@ -34,3 +43,269 @@ def test_update_timestamp():
         new_stats: os.stat_result = path.stat()
         assert orig_stats.st_atime_ns == new_stats.st_atime_ns
         assert orig_stats.st_mtime_ns == new_stats.st_mtime_ns
+
+
+def _make_tree(tree_path):
+    files = {
+        'a.cc': 'https://www.google.com/ and fonts.googleapis.com\n',
+        'b/c.js': 'no domains here\n',
+        'b/d.html': '<a href="https://chromium.org">crème</a>\n',
+        'e.py': 'URL = "https://goo.gl/foo"\n',
+    }
+    for relative_path, content in files.items():
+        (tree_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (tree_path / relative_path).write_text(content)
+    files_path = tree_path.parent / 'domain_substitution.list'
+    files_path.write_text('\n'.join(files))
+    return files_path
+
+
+def test_apply_substitution_jobs():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    results = []
+    for jobs in (1, 2):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tree_path = Path(tmpdirname, 'src')
+            files_path = _make_tree(tree_path)
+            cache_path = Path(tmpdirname, 'domsubcache.tar.gz')
+            domain_substitution.apply_substitution(regex_path, files_path, tree_path, cache_path,
+                                                   jobs)
+            tree = {
+                path.relative_to(tree_path).as_posix(): path.read_bytes()
+                for path in tree_path.rglob('*') if path.is_file()
+            }
+            with tarfile.open(str(cache_path)) as cache_tar:
+                cache = [(member.name, cache_tar.extractfile(member).read())
+                         for member in cache_tar.getmembers()]
+            results.append((tree, cache))
+    assert results[0] == results[1]
+    tree, cache = results[0]
+    assert b'google.com' not in tree['a.cc']
+    assert tree['b/c.js'] == b'no domains here\n'
+    cache_names = [name for name, _ in cache]
+    assert cache_names == ['orig/a.cc', 'orig/b/d.html', 'orig/e.py', 'cache_index.list']
+
+
+def test_required_literal():
+    assert domain_substitution._required_literal(
+        r'google([A-Za-z\-]*?\\*?)\.com(?!mon)') == 'google'
+    assert domain_substitution._required_literal(r'goo\.gl(e?)') == 'goo.gl'
+    assert domain_substitution._required_literal(r'(?<!http://schemas.)android(\\*?)\.com') == \
+        'android'
+    assert domain_substitution._required_literal(r'foo\.bar+baz') == 'foo.ba'
+    assert domain_substitution._required_literal('x{123}') is None
+    assert domain_substitution._required_literal(r'a{2,3}bcd') == 'bcd'
+    assert domain_substitution._required_literal(r'google\.com{1,}') == 'google.co'
+    assert domain_substitution._required_literal('foo{|bar') is None
+    assert domain_substitution._required_literal('a{x|b') is None
+    assert domain_substitution._required_literal('google|gstatic') is None
+    assert domain_substitution._required_literal('(?i)google') is None
+
+
+def test_substitute_path_prefilter():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    regex_list = domain_substitution.DomainRegexList(regex_path)
+    regex_pairs = regex_list.regex_pairs
+    fragments = ('google', 'googlezip', '.com', '.net', '\\', 'goo.gl', 'e', 'fonts', '.googleapis',
+                 'http://schemas.', 'android', 'beacons2', '.gvt1', 'x-y', 'mon')
+    random_state = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname, 'file')
+        for _ in range(200):
+            content = ''.join(random_state.choices(fragments, k=12))
+            expected = content
+            for regex_pair in regex_pairs:
+                expected = regex_pair.pattern.sub(regex_pair.replacement, expected)
+            path.write_text(content)
+            domain_substitution._substitute_path(path, regex_pairs)
+            assert path.read_text() == expected
+            path.write_text(content)
+            domain_substitution._substitute_path(path, regex_pairs, regex_list.bytes_regex_pairs)
+            assert path.read_text() == expected
+
+
+def test_decode_content():
+    assert domain_substitution._decode_content(b'', ()) == ('', 'UTF-8', ())
+    assert domain_substitution._decode_content('crème'.encode('ISO-8859-1'),
+                                               ()) == ('crème', 'ISO-8859-1', ())
+    with mock.patch.object(domain_substitution, 'TREE_ENCODINGS', ('UTF-8', )), \
+            pytest.raises(UnicodeDecodeError):
+        domain_substitution._decode_content(b'\xff', ())
+
+
+def test_bytes_regex_pairs():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        regex_path = Path(tmpdirname, 'domain_regex.list')
+        regex_path.write_text(r'google(\\*?)\.com#9oo91e\g<1>.qjz9zk')
+        assert domain_substitution.DomainRegexList(regex_path).bytes_regex_pairs
+        regex_path.write_text(r'google\s\.com#9oo91e.qjz9zk')
+        assert domain_substitution.DomainRegexList(regex_path).bytes_regex_pairs is None
+        regex_path.write_text(r'google{1,99999}#9oo91e')
+        regex_list = domain_substitution.DomainRegexList(regex_path)
+        path = Path(tmpdirname, 'file')
+        path.write_text('google.com')
+        domain_substitution._substitute_path(path, regex_list.regex_pairs,
+                                             regex_list.bytes_regex_pairs)
+        assert path.read_text() == '9oo91e.com'
+
+
+def test_apply_substitution_index():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tree_path = Path(tmpdirname, 'src')
+        index_dir = Path(tmpdirname, 'index')
+        files_path = _make_tree(tree_path)
+        domain_substitution.apply_substitution(regex_path, files_path, tree_path, None, 1,
+                                               index_dir)
+        substituted_content = (tree_path / 'a.cc').read_bytes()
+        assert len(list((index_dir / 'objects').iterdir())) == 3
+
+        # Substituted contents are reused from the index
+        _make_tree(tree_path)
+        with mock.patch.object(domain_substitution, '_substitute_content') as substitute_mock:
+            domain_substitution.apply_substitution(regex_path, files_path, tree_path, None, 1,
+                                                   index_dir)
+            substitute_mock.assert_not_called()
+        assert (tree_path / 'a.cc').read_bytes() == substituted_content
+
+
+def test_revert_substitution():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    for cache_name in ('domsubcache.tar', 'domsubcache.tar.gz', 'domsubcache.tar.xz'):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tree_path = Path(tmpdirname, 'src')
+            files_path = _make_tree(tree_path)
+            orig_tree = {path: path.read_bytes() for path in tree_path.rglob('*') if path.is_file()}
+            cache_path = Path(tmpdirname, cache_name)
+            domain_substitution.apply_substitution(regex_path, files_path, tree_path, cache_path)
+            assert (tree_path / 'a.cc').read_bytes() != orig_tree[tree_path / 'a.cc']
+            domain_substitution.revert_substitution(cache_path, tree_path)
+            for path, content in orig_tree.items():
+                assert path.read_bytes() == content
+            assert not cache_path.exists()
+
+
+def test_revert_substitution_replaces_files():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tree_path = Path(tmpdirname, 'src')
+        files_path = _make_tree(tree_path)
+        # The file index is larger than the read buffer, so reading it again would rewind
+        (tree_path / 'extra').mkdir()
+        for index in range(600):
+            (tree_path / 'extra' / f'{index}.cc').write_text('https://www.google.com/\n')
+        files_path.write_text(files_path.read_text() + ''.join(f'\nextra/{index}.cc'
+                                                               for index in range(600)))
+        orig_content = (tree_path / 'a.cc').read_bytes()
+        (tree_path / 'e.py').chmod(0o755)
+        cache_path = Path(tmpdirname, 'domsubcache.tar.gz')
+        domain_substitution.apply_substitution(regex_path, files_path, tree_path, cache_path)
+        # A substituted file that became a symlink is replaced, not written through
+        shared_path = Path(tmpdirname, 'shared.cc')
+        shared_content = (tree_path / 'a.cc').read_bytes()
+        shared_path.write_bytes(shared_content)
+        (tree_path / 'a.cc').unlink()
+        (tree_path / 'a.cc').symlink_to(shared_path)
+        with mock.patch.object(gzip._GzipReader,
+                               '_rewind',
+                               autospec=True,
+                               side_effect=gzip._GzipReader._rewind) as rewind_mock:
+            domain_substitution.revert_substitution(cache_path, tree_path)
+        # The cache is decompressed once for the member headers and once for the originals
+        assert rewind_mock.call_count <= 1
+        assert shared_path.read_bytes() == shared_content
+        assert not (tree_path / 'a.cc').is_symlink()
+        assert (tree_path / 'a.cc').read_bytes() == orig_content
+        assert (tree_path / 'e.py').stat().st_mode & 0o777 == 0o755
+
+
+def test_validate_file_index():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tree_path = Path(tmpdirname)
+        (tree_path / 'a').write_bytes(b'foo')
+        (tree_path / 'b').write_bytes(b'bar')
+        index_file = io.BytesIO(f'a|{zlib.crc32(b"foo"):08x}\n'
+                                f'b|{zlib.crc32(b"foo"):08x}\n'
+                                f'c|{zlib.crc32(b"foo"):08x}\n'.encode())
+        cache_index_files = set()
+        assert not domain_substitution._validate_file_index(index_file, tree_path,
+                                                            cache_index_files, 2)
+        assert cache_index_files == {'a'}
+
+
+def test_revert_substitution_paths():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    for cache_name in ('domsubcache.tar', 'domsubcache.tar.gz'):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tree_path = Path(tmpdirname, 'src')
+            files_path = _make_tree(tree_path)
+            orig_tree = {path: path.read_bytes() for path in tree_path.rglob('*') if path.is_file()}
+            cache_path = Path(tmpdirname, cache_name)
+            domain_substitution.apply_substitution(regex_path, files_path, tree_path, cache_path)
+            substituted_content = (tree_path / 'e.py').read_bytes()
+
+            # Paths that are not in the cache fail before any file is reverted
+            with pytest.raises(KeyError):
+                domain_substitution.revert_substitution(cache_path,
+                                                        tree_path,
+                                                        paths={'./a.cc', 'missing.cc'})
+            assert (tree_path / 'a.cc').read_bytes() != orig_tree[tree_path / 'a.cc']
+
+            domain_substitution.revert_substitution(cache_path, tree_path, paths={'./a.cc'})
+            assert (tree_path / 'a.cc').read_bytes() == orig_tree[tree_path / 'a.cc']
+            assert (tree_path / 'e.py').read_bytes() == substituted_content
+            assert cache_path.exists()
+
+            domain_substitution.revert_substitution(cache_path, tree_path)
+            for path, content in orig_tree.items():
+                assert path.read_bytes() == content
+            assert not cache_path.exists()
+
+
+def test_report_substitution():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tree_path = Path(tmpdirname, 'src')
+        files_path = _make_tree(tree_path)
+        orig_contents = {path: path.read_bytes() for path in tree_path.rglob('*') if path.is_file()}
+        pattern_stats, files_scanned, bytes_scanned, slowest_files = \
+            domain_substitution.report_substitution(regex_path, files_path, tree_path, 2)
+        assert files_scanned == 4
+        assert bytes_scanned == sum(map(len, orig_contents.values()))
+        assert len(slowest_files) == 2
+        assert len(pattern_stats) == len(
+            domain_substitution.DomainRegexList(regex_path).regex_pairs)
+        assert sum(matches for _, matches, _ in pattern_stats) == 4
+        for path, content in orig_contents.items():
+            assert path.read_bytes() == content
+
+
+def test_substitute_path_mmap_gate():
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    regex_list = domain_substitution.DomainRegexList(regex_path)
+    assert len(regex_list.search_literals) == len(regex_list.regex_pairs)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname, 'file')
+        for content in (b'', b'no domains here\n'):
+            path.write_bytes(content)
+            with mock.patch.object(domain_substitution, '_substitute_content') as substitute_mock:
+                assert domain_substitution._substitute_path(path,
+                                                            regex_list.regex_pairs) == (None, None)
+                _, _, index_entry = domain_substitution._substitute_path_incremental(
+                    path, regex_list.regex_pairs, None, None, Path(tmpdirname))
+                substitute_mock.assert_not_called()
+            assert index_entry == (hashlib.sha256(content).hexdigest(), '')
+            assert path.read_bytes() == content
+        path.write_bytes(b'https://www.google.com/\n')
+        crc32_hash, orig_content = domain_substitution._substitute_path(
+            path, regex_list.regex_pairs)
+        assert orig_content == b'https://www.google.com/\n'
+        assert crc32_hash == zlib.crc32(path.read_bytes())
+        # The regex pairs are read more than once, so any iterable must work
+        path.write_bytes(b'https://www.google.com/\n')
+        assert domain_substitution._substitute_path(path, iter(
+            regex_list.regex_pairs))[1] == b'https://www.google.com/\n'
+        path.write_bytes(b'https://www.google.com/\n')
+        _, _, index_entry = domain_substitution._substitute_path_incremental(
+            path, iter(regex_list.regex_pairs), None, None, Path(tmpdirname))
+        assert index_entry[1]
@@ -0,0 +1,402 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import contextlib
+import functools
+import io
+import hashlib
+import http.server
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from .. import _common, _download_store, downloads
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class _CountingHandler(_QuietHandler):
+    request_count = 0
+
+    def do_GET(self):
+        type(self).request_count += 1
+        super().do_GET()
+
+
+class _RangeHandler(_QuietHandler):
+    requested_ranges = []
+
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is None:
+            return super().send_head()
+        path = Path(self.translate_path(self.path))
+        size = path.stat().st_size
+        start, end = int(match.group(1)), min(int(match.group(2) or size - 1), size - 1)
+        self.requested_ranges.append((start, end))
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+        with path.open('rb') as file_obj:
+            file_obj.seek(start)
+            content = file_obj.read(end + 1 - start)
+        return io.BytesIO(content)
+
+
+class _SlowFile(io.BytesIO):
+
+    def __init__(self, content, delay):
+        super().__init__(content)
+        self._delay = delay
+
+    def read(self, size=-1):
+        time.sleep(self._delay)
+        return super().read(100)
+
+
+class _SlowRangeHandler(_RangeHandler):
+    # Segments starting at failing_start fail, and the others are sent slowly
+    failing_start = None
+    read_delay = 0
+
+    def send_head(self):
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith(f'bytes={self.failing_start}-'):
+            self.send_error(500)
+            return None
+        content_file = super().send_head()
+        if range_header == 'bytes=0-0':
+            return content_file
+        return _SlowFile(content_file.getvalue(), self.read_delay)
+
+
+@contextlib.contextmanager
+def _serve_directory(directory, handler_class=_QuietHandler):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             functools.partial(handler_class,
+                                                               directory=str(directory)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _write_downloads_ini(ini_path, base_url, files, sha256_overrides=None):
+    sections = []
+    for index, (name, content) in enumerate(sorted(files.items())):
+        sha256 = hashlib.sha256(content).hexdigest()
+        if sha256_overrides and name in sha256_overrides:
+            sha256 = sha256_overrides[name]
+        sections.append(f'[component{index}]\n'
+                        f'url = {base_url}/{name}\n'
+                        f'download_filename = {name}\n'
+                        f'sha256 = {sha256}\n'
+                        f'output_path = component{index}\n')
+    ini_path.write_text('\n'.join(sections))
+    return downloads.DownloadInfo([ini_path])
+
+
+@pytest.mark.parametrize('downloader', ('curl', None))
+@pytest.mark.parametrize('jobs', (1, 4))
+def test_retrieve_downloads(downloader, jobs):
+    if downloader is not None and shutil.which(downloader) is None:
+        pytest.skip(f'{downloader} is not available')
+    files = {f'file{index}.tar.xz': bytes([index]) * (index * 10000 + 1) for index in range(6)}
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        for name, content in files.items():
+            (server_dir / name).write_bytes(content)
+        cache_dir = Path(tmpdirname, 'cache')
+        cache_dir.mkdir()
+        with _serve_directory(server_dir) as base_url, \
+                mock.patch.object(downloads.shutil, 'which', return_value=downloader):
+            info = _write_downloads_ini(Path(tmpdirname, 'downloads.ini'), base_url, files)
+            downloads.retrieve_downloads(info, cache_dir, None, True, jobs=jobs, verify=True)
+            for name, content in files.items():
+                assert (cache_dir / name).read_bytes() == content
+            assert not list(cache_dir.glob('*.partial'))
+
+            (cache_dir / 'file3.tar.xz').unlink()
+            info = _write_downloads_ini(Path(tmpdirname, 'downloads.ini'), base_url, files,
+                                        {'file3.tar.xz': '0' * 64})
+            with pytest.raises(downloads.HashMismatchError):
+                downloads.retrieve_downloads(info, cache_dir, None, False, jobs=jobs, verify=True)
+
+
+def test_download_segmented():
+    content = bytes(range(256)) * 41
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        (server_dir / 'file.tar.xz').write_bytes(content)
+        file_path = Path(tmpdirname, 'file.tar.xz')
+        tmp_file_path = Path(tmpdirname, 'file.tar.xz.partial')
+        map_path = Path(tmpdirname, 'file.tar.xz.partial.segments')
+        with _serve_directory(server_dir, _RangeHandler) as base_url, \
+                mock.patch.object(downloads, '_SEGMENT_BYTES', 1000), \
+                mock.patch.object(downloads.shutil, 'which', return_value=None):
+            _RangeHandler.requested_ranges = []
+            downloads._download_if_needed(file_path, f'{base_url}/file.tar.xz', False, False, 4)
+            assert file_path.read_bytes() == content
+            assert not tmp_file_path.exists() and not map_path.exists()
+            assert sorted(_RangeHandler.requested_ranges)[1:] == [
+                (start, min(start + 999,
+                            len(content) - 1)) for start in range(0, len(content), 1000)
+            ]
+
+            # Only the missing segments are requested when resuming
+            file_path.unlink()
+            tmp_file_path.write_bytes(content[:6000] + bytes(len(content) - 6000))
+            map_path.write_text(
+                json.dumps({
+                    'size': len(content),
+                    'segment_bytes': 1000,
+                    'finished': list(range(6))
+                }))
+            _RangeHandler.requested_ranges = []
+            downloads._download_if_needed(file_path, f'{base_url}/file.tar.xz', False, False, 4)
+            assert file_path.read_bytes() == content
+            assert min(_RangeHandler.requested_ranges[1:]) == (6000, 6999)
+            assert len(_RangeHandler.requested_ranges) == 6
+
+        # Servers without range requests fall back to a single connection
+        file_path.unlink()
+        with _serve_directory(server_dir) as base_url, \
+                mock.patch.object(downloads, '_SEGMENT_BYTES', 1000), \
+                mock.patch.object(downloads.shutil, 'which', return_value=None):
+            downloads._download_if_needed(file_path, f'{base_url}/file.tar.xz', False, False, 4)
+            assert file_path.read_bytes() == content
+
+
+def test_download_segmented_failure():
+    content = bytes(range(256)) * 41
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        (server_dir / 'file.tar.xz').write_bytes(content)
+        tmp_file_path = Path(tmpdirname, 'file.tar.xz.partial')
+        with _serve_directory(server_dir, _SlowRangeHandler) as base_url, \
+                mock.patch.object(downloads, '_SEGMENT_BYTES', 1000), \
+                mock.patch.object(downloads, '_SEGMENT_READ_BYTES', 100):
+            # Stalled segments time out
+            _SlowRangeHandler.read_delay = 2
+            with mock.patch.object(downloads, '_SEGMENT_TIMEOUT', 0.5), \
+                    pytest.raises(OSError):
+                downloads._SegmentedDownload(f'{base_url}/file.tar.xz', tmp_file_path, False,
+                                             False).run(4)
+
+            # The other segments stop when a segment fails
+            _SlowRangeHandler.read_delay = 0.2
+            _SlowRangeHandler.failing_start = 1000
+            _SlowRangeHandler.requested_ranges = []
+            start_time = time.monotonic()
+            with pytest.raises(urllib.error.HTTPError):
+                downloads._SegmentedDownload(f'{base_url}/file.tar.xz', tmp_file_path, False,
+                                             False).run(2)
+            assert time.monotonic() - start_time < 1.5
+            assert len(_SlowRangeHandler.requested_ranges) < 4
+
+
+def test_retrieve_downloads_store():
+    files = {f'file{index}.tar.xz': bytes([index]) * 1000 for index in range(3)}
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        for name, content in files.items():
+            (server_dir / name).write_bytes(content)
+        store = _download_store.DownloadStore(Path(tmpdirname, 'store'))
+        with _serve_directory(server_dir, _CountingHandler) as base_url, \
+                mock.patch.object(downloads.shutil, 'which', return_value=None):
+            info = _write_downloads_ini(Path(tmpdirname, 'downloads.ini'), base_url, files)
+            _CountingHandler.request_count = 0
+            for cache_name in ('cache1', 'cache2'):
+                cache_dir = Path(tmpdirname, cache_name)
+                cache_dir.mkdir()
+                downloads.retrieve_downloads(info, cache_dir, None, False, verify=True, store=store)
+            assert _CountingHandler.request_count == len(files)
+
+            # Corrupt downloads in the store are removed and downloaded again
+            object_path = Path(tmpdirname, 'store', 'objects',
+                               f'sha256-{hashlib.sha256(files["file0.tar.xz"]).hexdigest()}')
+            object_path.unlink()
+            object_path.write_bytes(b'corrupt')
+            cache_dir = Path(tmpdirname, 'cache3')
+            cache_dir.mkdir()
+            downloads.retrieve_downloads(info, cache_dir, None, False, verify=True, store=store)
+            assert _CountingHandler.request_count == len(files) + 1
+            assert (cache_dir / 'file0.tar.xz').read_bytes() == files['file0.tar.xz']
+            assert object_path.read_bytes() == files['file0.tar.xz']
+        for name, content in files.items():
+            cache1_path = Path(tmpdirname, 'cache1', name)
+            cache2_path = Path(tmpdirname, 'cache2', name)
+            assert cache2_path.read_bytes() == content
+            assert cache1_path.stat().st_ino == cache2_path.stat().st_ino
+        assert not [
+            path for path in Path(tmpdirname, 'cache2').iterdir()
+            if path.name not in files and 'verified_downloads.json' not in path.name
+        ]
+
+
+def test_download_store_evict():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        store_dir = Path(tmpdirname, 'store')
+        store = _download_store.DownloadStore(store_dir, max_size=250)
+        for index in range(3):
+            source = Path(tmpdirname, f'file{index}')
+            source.write_bytes(bytes(100))
+            store.add(f'key{index}', source)
+            os.utime(store_dir / 'used' / f'key{index}', ns=(index, index))
+        assert sorted(path.name for path in (store_dir / 'objects').iterdir()) == ['key1', 'key2']
+
+        # Materializing a download marks it as used
+        assert store.materialize('key1', Path(tmpdirname, 'materialized'))
+        assert not store.materialize('key0', Path(tmpdirname, 'missing'))
+        store.add('key3', Path(tmpdirname, 'file0'))
+        assert sorted(path.name for path in (store_dir / 'objects').iterdir()) == ['key1', 'key3']
+
+
+@pytest.mark.skipif(_common.fcntl is None, reason='requires fcntl')
+def test_download_store_evict_lock():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        store_dir = Path(tmpdirname, 'store')
+        store = _download_store.DownloadStore(store_dir, max_size=0)
+        (store_dir / 'objects' / 'key').write_bytes(b'content')
+        # Another process holds the lock while it evicts downloads
+        with (store_dir / '.lock').open('a') as lock_file:
+            _common.fcntl.flock(lock_file.fileno(), _common.fcntl.LOCK_EX)
+            evict_thread = threading.Thread(target=store.evict)
+            evict_thread.start()
+            evict_thread.join(0.2)
+            assert evict_thread.is_alive()
+            assert (store_dir / 'objects' / 'key').exists()
+            _common.fcntl.flock(lock_file.fileno(), _common.fcntl.LOCK_UN)
+        evict_thread.join()
+        assert not (store_dir / 'objects' / 'key').exists()
+
+
+def test_link_file_fallback():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source = Path(tmpdirname, 'source')
+        source.write_bytes(b'content')
+        with mock.patch.object(_common.os, 'link', side_effect=OSError), \
+                mock.patch.object(_common, '_reflink_file', side_effect=OSError):
+            assert _common.link_file(source, Path(tmpdirname, 'copy')) == \
+                _common.LinkModeEnum.COPY
+        assert Path(tmpdirname, 'copy').read_bytes() == b'content'
+        assert _common.link_file(source, Path(tmpdirname, 'link'),
+                                 (_common.LinkModeEnum.HARDLINK, )) == \
+            _common.LinkModeEnum.HARDLINK
+        with pytest.raises(FileExistsError):
+            _common.link_file(source, Path(tmpdirname, 'copy'))
+
+
+@pytest.mark.parametrize('downloader', ('curl', None))
+def test_retrieve_downloads_hash_inline(downloader):
+    if downloader is not None and shutil.which(downloader) is None:
+        pytest.skip(f'{downloader} is not available')
+    files = {f'file{index}.tar.xz': bytes([index]) * 5000 for index in range(3)}
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        for name, content in files.items():
+            (server_dir / name).write_bytes(content)
+        cache_dir = Path(tmpdirname, 'cache')
+        cache_dir.mkdir()
+        with _serve_directory(server_dir) as base_url, \
+                mock.patch.object(downloads.shutil, 'which', return_value=downloader), \
+                mock.patch.object(downloads, '_hash_file', wraps=downloads._hash_file) as hash_mock:
+            info = _write_downloads_ini(Path(tmpdirname, 'downloads.ini'), base_url, files)
+            downloads.retrieve_downloads(info, cache_dir, None, False, verify=True)
+            hash_mock.assert_not_called()
+
+            # Verified files are not read again
+            downloads.check_downloads(info, cache_dir, None)
+            hash_mock.assert_not_called()
+
+            # Files are read once for all hashes if verification is forced
+            downloads.check_downloads(info, cache_dir, None, jobs=2, force_verify=True)
+            assert hash_mock.call_count == len(files)
+            (cache_dir / 'verified_downloads.json').unlink()
+            downloads.check_downloads(info, cache_dir, None, jobs=2)
+            assert hash_mock.call_count == 2 * len(files)
+
+            # Recorded hashes are compared with changed expected hashes
+            wrong_info = _write_downloads_ini(Path(tmpdirname, 'wrong.ini'), base_url, files,
+                                              {'file0.tar.xz': '0' * 64})
+            with pytest.raises(downloads.HashMismatchError):
+                downloads.check_downloads(wrong_info, cache_dir, None)
+            assert hash_mock.call_count == 2 * len(files)
+
+            # Modified files are verified again
+            (cache_dir / 'file1.tar.xz').write_bytes(b'modified')
+            with pytest.raises(downloads.HashMismatchError):
+                downloads.check_downloads(info, cache_dir, None, jobs=2)
+
+
+@pytest.mark.skipif(_common.fcntl is None, reason='requires fcntl')
+def test_stamp_database_lock():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache_dir = Path(tmpdirname)
+        download_path = cache_dir / 'file.tar.xz'
+        download_path.write_bytes(b'content')
+        stamps = downloads._StampDatabase(cache_dir)
+        # Another process holds the lock while it updates the database
+        with (cache_dir / '.verified_downloads.json.lock').open('a') as lock_file:
+            _common.fcntl.flock(lock_file.fileno(), _common.fcntl.LOCK_EX)
+            record_thread = threading.Thread(target=stamps.record,
+                                             args=(download_path, {
+                                                 'sha256': '0' * 64
+                                             }))
+            record_thread.start()
+            record_thread.join(0.2)
+            assert record_thread.is_alive()
+            _common.fcntl.flock(lock_file.fileno(), _common.fcntl.LOCK_UN)
+        record_thread.join()
+        assert stamps.get_digests(download_path) == {'sha256': '0' * 64}
+
+
+def test_download_via_curl_resume_hashes():
+    if shutil.which('curl') is None:
+        pytest.skip('curl is not available')
+    content = bytes(range(256)) * 20
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        server_dir = Path(tmpdirname, 'server')
+        server_dir.mkdir()
+        (server_dir / 'file.tar.xz').write_bytes(content)
+        file_path = Path(tmpdirname, 'file.tar.xz')
+        Path(tmpdirname, 'file.tar.xz.partial').write_bytes(content[:1000])
+        with _serve_directory(server_dir, _RangeHandler) as base_url:
+            _RangeHandler.requested_ranges = []
+            digests = downloads._download_if_needed(file_path,
+                                                    f'{base_url}/file.tar.xz',
+                                                    False,
+                                                    False,
+                                                    hash_names=('md5', 'sha512'))
+        assert file_path.read_bytes() == content
+        assert _RangeHandler.requested_ranges == [(1000, len(content) - 1)]
+        assert digests == {
+            'md5': hashlib.md5(content).hexdigest(),
+            'sha512': hashlib.sha512(content).hexdigest(),
+        }
@@ -0,0 +1,199 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import io
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from .. import _extraction
+
+_FILES = ('a.cc', 'b/c.bin', 'b/d.cc', 'e/f.bin')
+_SKIP_PATHS = frozenset(('b/c.bin', 'e/f.bin', 'missing.bin'))
+
+
+def _make_archive(archive_path):
+    with tarfile.open(archive_path, f'w:{archive_path.suffix[1:]}') as tar_file:
+        for relative_path in _FILES:
+            tarinfo = tarfile.TarInfo(f'chromium-1.0/{relative_path}')
+            tarinfo.size = len(relative_path)
+            tar_file.addfile(tarinfo, io.BytesIO(relative_path.encode()))
+
+
+def _extracted_files(output_dir):
+    return sorted(
+        path.relative_to(output_dir).as_posix() for path in output_dir.rglob('*') if path.is_file())
+
+
+def test_extract_tar_with_python_skip_paths():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, 'chromium.tar.gz')
+        output_dir = Path(tmpdirname, 'src')
+        output_dir.mkdir()
+        _make_archive(archive_path)
+        _extraction._extract_tar_with_python(archive_path, output_dir, Path('chromium-1.0'),
+                                             _SKIP_PATHS)
+        assert _extracted_files(output_dir) == ['a.cc', 'b/d.cc']
+
+
+@pytest.mark.parametrize('is_gnu_tar', (True, False))
+def test_extract_tar_with_tar_skip_paths(is_gnu_tar):
+    tar_bin = shutil.which('tar')
+    if tar_bin is None or (is_gnu_tar and not _extraction._is_gnu_tar(tar_bin)):
+        pytest.skip('GNU tar is not available')
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, 'chromium.tar.gz')
+        output_dir = Path(tmpdirname, 'src')
+        _make_archive(archive_path)
+        with mock.patch.object(_extraction, '_is_gnu_tar', return_value=is_gnu_tar):
+            _extraction._extract_tar_with_tar(tar_bin, archive_path, output_dir,
+                                              Path('chromium-1.0'), _SKIP_PATHS)
+        assert _extracted_files(output_dir) == ['a.cc', 'b/d.cc']
+
+
+@pytest.mark.parametrize('suffix', ('.gz', '.bz2', '.xz'))
+@pytest.mark.parametrize('parallel', (True, False))
+def test_extract_tar_decompressed(suffix, parallel):
+    tar_bin = shutil.which('tar')
+    if parallel and _extraction._find_parallel_decompressor(Path(f'a.tar{suffix}')) is None:
+        pytest.skip('No parallel decompressor is available')
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, f'chromium.tar{suffix}')
+        _make_archive(archive_path)
+        with mock.patch.object(_extraction, '_DECOMPRESS_CHUNK_BYTES', 64), \
+                mock.patch.object(_extraction, '_DECOMPRESS_QUEUE_CHUNKS', 1):
+            if not parallel:
+                mock.patch.object(_extraction, '_find_parallel_decompressor',
+                                  return_value=None).start()
+            try:
+                output_dir = Path(tmpdirname, 'python')
+                output_dir.mkdir()
+                _extraction._extract_tar_with_python(archive_path, output_dir, Path('chromium-1.0'))
+                assert _extracted_files(output_dir) == sorted(_FILES)
+                if tar_bin is not None:
+                    output_dir = Path(tmpdirname, 'tar')
+                    _extraction._extract_tar_with_tar(tar_bin, archive_path, output_dir,
+                                                      Path('chromium-1.0'))
+                    assert _extracted_files(output_dir) == sorted(_FILES)
+            finally:
+                mock.patch.stopall()
+
+
+def test_threaded_decompressor_close():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, 'chromium.tar.xz')
+        _make_archive(archive_path)
+        with mock.patch.object(_extraction, '_DECOMPRESS_CHUNK_BYTES', 16), \
+                mock.patch.object(_extraction, '_DECOMPRESS_QUEUE_CHUNKS', 1):
+            decompressor = _extraction._ThreadedDecompressor(
+                archive_path, _extraction._PYTHON_DECOMPRESSORS['.xz'])
+            assert decompressor.read(4) == b'chro'
+            decompressor.close()
+        assert not decompressor._thread.is_alive()
+
+
+def test_extract_tar_with_python_writers():
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, 'chromium.tar.gz')
+        with tarfile.open(archive_path, 'w:gz') as tar_file:
+            tarinfo = tarfile.TarInfo('chromium-1.0/b')
+            tarinfo.type = tarfile.DIRTYPE
+            tarinfo.mode = 0o755
+            tar_file.addfile(tarinfo)
+            for index in range(50):
+                tarinfo = tarfile.TarInfo(f'chromium-1.0/b/{index % 7}/{index}.cc')
+                tarinfo.size = len(tarinfo.name)
+                tarinfo.mode = 0o755 if index % 2 else 0o644
+                tarinfo.mtime = 1000000000 + index
+                tarinfo.uid = tarinfo.gid = 1234
+                tar_file.addfile(tarinfo, io.BytesIO(tarinfo.name.encode()))
+            tarinfo = tarfile.TarInfo('chromium-1.0/link.cc')
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = 'b/0/0.cc'
+            tar_file.addfile(tarinfo)
+            tarinfo = tarfile.TarInfo('chromium-1.0/e/hardlink.cc')
+            tarinfo.type = tarfile.LNKTYPE
+            tarinfo.linkname = 'chromium-1.0/b/1/1.cc'
+            tar_file.addfile(tarinfo)
+            # Later members replace earlier ones at the same path
+            for name, content in (('dup.cc', b'first'), ('replaced.cc', b'x' * 1000),
+                                  ('big.cc', b'y' * 1000), ('dup.cc', b'second' * 200)):
+                tarinfo = tarfile.TarInfo(f'chromium-1.0/{name}')
+                tarinfo.size = len(content)
+                tar_file.addfile(tarinfo, io.BytesIO(content))
+                if name == 'replaced.cc':
+                    tarinfo = tarfile.TarInfo('chromium-1.0/dup_hardlink.cc')
+                    tarinfo.type = tarfile.LNKTYPE
+                    tarinfo.linkname = 'chromium-1.0/dup.cc'
+                    tar_file.addfile(tarinfo)
+            tarinfo = tarfile.TarInfo('chromium-1.0/replaced.cc')
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = 'big.cc'
+            tar_file.addfile(tarinfo)
+        for writers in (1, 4):
+            output_dir = Path(tmpdirname, f'src{writers}')
+            output_dir.mkdir()
+            # Files larger than the limit of pending bytes are written while they are read
+            with mock.patch.object(_extraction, '_WRITER_PENDING_BYTES', 100):
+                _extraction._extract_tar_with_python(
+                    archive_path,
+                    output_dir,
+                    Path('chromium-1.0'),
+                    skip_paths={'b/2/2.cc'},
+                    rewrite_paths={'b/3/3.cc': lambda content: b'rewritten'},
+                    writers=writers)
+            results.append({
+                path.relative_to(output_dir).as_posix():
+                (path.is_symlink(), path.read_bytes(), path.stat().st_mode, path.stat().st_mtime,
+                 path.stat().st_nlink, path.stat().st_uid)
+                for path in output_dir.rglob('*') if path.is_file()
+            })
+    assert results[0] == results[1]
+    assert 'b/2/2.cc' not in results[1]
+    assert results[1]['b/3/3.cc'][1] == b'rewritten'
+    # Rewritten members have the attributes from the archive like other members
+    assert stat.S_IMODE(results[0]['b/3/3.cc'][2]) == 0o755
+    assert results[0]['b/3/3.cc'][3] == 1000000003
+    if getattr(os, 'geteuid', lambda: None)() == 0:
+        assert results[0]['b/3/3.cc'][5] == 1234
+    assert results[1]['link.cc'][0]
+    assert results[1]['e/hardlink.cc'][4] == 2
+    assert results[1]['dup.cc'][1] == results[1]['dup_hardlink.cc'][1] == b'second' * 200
+    assert results[1]['replaced.cc'][:2] == (True, b'y' * 1000)
+
+
+@pytest.mark.parametrize('member_prefix', ('', './'))
+@pytest.mark.parametrize('tar_cmd', ('tar', 'bsdtar'))
+def test_extract_tar_with_tar_strip(tar_cmd, member_prefix):
+    tar_bin = shutil.which(tar_cmd)
+    if tar_bin is None:
+        pytest.skip(f'{tar_cmd} is not available')
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        archive_path = Path(tmpdirname, 'chromium.tar')
+        with tarfile.open(archive_path, 'w') as tar_file:
+            for name in ('chromium-1.0/out/a.cc', 'chromium-1.0/out/b/c.cc', 'other/d.cc'):
+                tarinfo = tarfile.TarInfo(member_prefix + name)
+                tarinfo.size = len(name)
+                tar_file.addfile(tarinfo, io.BytesIO(name.encode()))
+        output_dir = Path(tmpdirname, 'src')
+        _extraction._extract_tar_with_tar(tar_bin, archive_path, output_dir,
+                                          Path('chromium-1.0/out'))
+        assert _extracted_files(output_dir) == ['a.cc', 'b/c.cc']
+        assert (output_dir / 'b/c.cc').read_bytes() == b'chromium-1.0/out/b/c.cc'
+        skipped_dir = Path(tmpdirname, 'skipped')
+        _extraction._extract_tar_with_tar(tar_bin, archive_path, skipped_dir,
+                                          Path('chromium-1.0/out'), {'b/c.cc'})
+        assert _extracted_files(skipped_dir) == ['a.cc']
+        with pytest.raises(ChildProcessError):
+            _extraction._extract_tar_with_tar(tar_bin, archive_path, Path(tmpdirname, 'missing'),
+                                              Path('missing'))
@@ -7,6 +7,7 @@
 from pathlib import Path
 import os
 import shutil
+import tempfile
 
 import pytest
 
@@ -38,3 +39,39 @@ def test_patch_from_env():
 
     del os.environ['PATCH_BIN']
     assert patches._find_patch_from_env() is None
+
+
+def test_merge_patches_link_modes():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        sources = []
+        for source_name, patch_names in (('a', ('x/1.patch', 'x/y/2.patch')), ('b', ('x/3.patch',
+                                                                                     'z/4.patch'))):
+            source_dir = Path(tmpdirname, source_name)
+            for patch_name in patch_names:
+                (source_dir / patch_name).parent.mkdir(parents=True, exist_ok=True)
+                (source_dir / patch_name).write_text(f'{source_name}/{patch_name}\n')
+            (source_dir / 'series').write_text('\n'.join(patch_names))
+            sources.append(source_dir)
+        for link_modes, same_inode in (((patches.LinkModeEnum.HARDLINK, ), True),
+                                       ((patches.LinkModeEnum.COPY, ), False)):
+            destination = Path(tmpdirname, f'merged_{link_modes[0].value}')
+            patches.merge_patches(sources, destination, link_modes=link_modes)
+            assert (destination / 'series').read_text().splitlines() == [
+                'x/1.patch', 'x/y/2.patch', 'x/3.patch', 'z/4.patch'
+            ]
+            assert (destination / 'z/4.patch').read_text() == 'b/z/4.patch\n'
+            assert ((destination /
+                     'x/y/2.patch').stat().st_ino == (sources[0] /
+                                                      'x/y/2.patch').stat().st_ino) == same_inode
+
+        # Existing patches in the destination are kept when prepending
+        destination = Path(tmpdirname, 'merged_copy')
+        prepend_dir = Path(tmpdirname, 'c')
+        (prepend_dir / 'x').mkdir(parents=True)
+        (prepend_dir / 'x/0.patch').write_text('c/x/0.patch\n')
+        (prepend_dir / 'series').write_text('x/0.patch')
+        patches.merge_patches([prepend_dir],
+                              destination,
+                              prepend=True,
+                              link_modes=(patches.LinkModeEnum.HARDLINK, ))
+        assert (destination / 'series').read_text().splitlines()[:2] == ['x/0.patch', 'x/1.patch']
@@ -0,0 +1,152 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import io
+import shutil
+import tarfile
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from .. import domain_substitution, downloads, patches, prepare_source, prune_binaries
+
+_FILES = {
+    'a.cc': 'https://www.google.com/\n',
+    'b/c.js': 'no domains here\n',
+    'b/d.cc': 'const char kUrl[] = "https://www.google.com/";\nint x = 1;\n',
+    'e.bin': '\0binary\0',
+    'third_party/llvm/f.cc': 'contingent\n',
+    'third_party/llvm/BUILD.gn': 'kept\n',
+}
+# Components that are not part of the main archive
+_FONTS_FILES = {'g.js': 'fonts.googleapis.com\n'}
+_NODE_FILES = {'h.js': 'https://www.google.com/\n', 'i.js': 'no domains here\n'}
+_PATCH = '''--- a/b/d.cc
++++ b/b/d.cc
+@@ -1,2 +1,2 @@
+ const char kUrl[] = "https://www.google.com/";
+-int x = 1;
++int x = 2;
+'''
+
+
+def _write_tar(archive_path, prefix, files):
+    with tarfile.open(archive_path, 'w:xz') as tar_file:
+        for relative_path, content in files.items():
+            tarinfo = tarfile.TarInfo(f'{prefix}{relative_path}')
+            tarinfo.size = len(content)
+            tarinfo.mtime = 1000000000
+            tar_file.addfile(tarinfo, io.BytesIO(content.encode()))
+
+
+def _extract_with_tarfile(archive_path, output_dir, relative_to, extractors=None, skip_paths=None):
+    # Stands in for 7-Zip, which is not available on all hosts
+    assert relative_to is None and extractors is None and not skip_paths
+    with tarfile.open(archive_path) as tar_file:
+        tar_file.extractall(output_dir)
+
+
+def _make_inputs(root):
+    cache_dir = root / 'download_cache'
+    cache_dir.mkdir()
+    _write_tar(cache_dir / 'chromium.tar.xz', 'chromium-1.0/', _FILES)
+    _write_tar(cache_dir / 'fonts.tar.xz', '', _FONTS_FILES)
+    _write_tar(cache_dir / 'node.7z', '', _NODE_FILES)
+    ini_path = root / 'downloads.ini'
+    ini_path.write_text('[chromium]\nurl = https://localhost/chromium.tar.xz\n'
+                        'download_filename = chromium.tar.xz\noutput_path = ./\n'
+                        'strip_leading_dirs = chromium-1.0\n'
+                        '[fonts]\nurl = https://localhost/fonts.tar.xz\n'
+                        'download_filename = fonts.tar.xz\noutput_path = third_party/fonts\n'
+                        '[node]\nurl = https://localhost/node.7z\n'
+                        'download_filename = node.7z\noutput_path = third_party/node\n'
+                        'extractor = 7z\n')
+    (root / 'pruning.list').write_text('e.bin\n')
+    (root / 'domain_substitution.list').write_text(
+        'a.cc\nb/c.js\nb/d.cc\nthird_party/fonts/g.js\nthird_party/node/h.js\n'
+        'third_party/node/i.js\n')
+    patches_dir = root / 'patches'
+    patches_dir.mkdir()
+    (patches_dir / 'series').write_text('d.patch\n')
+    (patches_dir / 'd.patch').write_text(_PATCH)
+    return cache_dir, downloads.DownloadInfo((ini_path, )), patches_dir
+
+
+def _tree_state(tree_path):
+    # The modification time of the patched file depends on when it was patched
+    return {
+        path.relative_to(tree_path).as_posix():
+        (path.read_bytes(), None if path.name == 'd.cc' else path.stat().st_mtime_ns)
+        for path in tree_path.rglob('*') if path.is_file()
+    }
+
+
+def test_get_patched_paths():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        patches_dir = Path(tmpdirname)
+        (patches_dir / 'series').write_text('a.patch\n')
+        (patches_dir / 'a.patch').write_text('''Description of the patch
+--- not a header
+
+--- a/docs/a.md
++++ b/docs/a.md
+@@ -1,4 +1,3 @@
+ # Title
+--- a/removed.cc
+-+++ b/removed.cc
++@@ -1 +1 @@
+ text
+@@ -10 +10,2 @@
+--- a/also_removed.cc
+++++ b/added.cc
++\\ text
+\\ No newline at end of file
+--- /dev/null
++++ b/new.cc
+@@ -0,0 +1 @@
++new
+''')
+        assert prepare_source.get_patched_paths((patches_dir, )) == {'docs/a.md', 'new.cc'}
+
+
+def test_prepare_source():
+    if shutil.which('patch') is None:
+        pytest.skip('patch is not available')
+    regex_path = Path(__file__).resolve().parent.parent.parent / 'domain_regex.list'
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        root = Path(tmpdirname)
+        cache_dir, download_info, patches_dir = _make_inputs(root)
+        lists = (root / 'pruning.list', regex_path, root / 'domain_substitution.list')
+
+        # prepare_source uses the modules of the utils directory, not those of the package
+        with mock.patch.dict(downloads.unpack_downloads.__globals__,
+                             extract_with_7z=_extract_with_tarfile), \
+                mock.patch.dict(prepare_source.unpack_downloads.__globals__,
+                                extract_with_7z=_extract_with_tarfile):
+            # Separate steps
+            separate_tree = root / 'separate'
+            downloads.unpack_downloads(download_info, cache_dir, None, separate_tree)
+            prune_binaries.prune_dirs(separate_tree, False, None)
+            prune_binaries.prune_files(separate_tree, ('e.bin', ))
+            patches.apply_patches(patches.generate_patches_from_series(patches_dir, resolve=True),
+                                  separate_tree)
+            domain_substitution.apply_substitution(regex_path, lists[2], separate_tree,
+                                                   root / 'separate.tar')
+
+            fused_tree = root / 'fused'
+            prepare_source.prepare_source(download_info, cache_dir, fused_tree, lists,
+                                          root / 'fused.tar', (patches_dir, ))
+            fused_state = _tree_state(fused_tree)
+            assert fused_state == _tree_state(separate_tree)
+            assert b'9oo91e' in fused_state['b/d.cc'][0] and b'x = 2' in fused_state['b/d.cc'][0]
+            assert b'9oo91e' in fused_state['third_party/fonts/g.js'][0]
+            assert b'9oo91e' in fused_state['third_party/node/h.js'][0]
+
+            domain_substitution.revert_substitution(root / 'fused.tar', fused_tree)
+            domain_substitution.revert_substitution(root / 'separate.tar', separate_tree)
+            assert _tree_state(fused_tree) == _tree_state(separate_tree)
@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import stat
+import tempfile
+from pathlib import Path
+
+from .. import prune_binaries
+
+
+def test_prune_files_jobs():
+    prune_list = ('a.bin', 'b/c.bin', 'b/d.bin', 'b/e/f.bin', 'missing/g.bin', 'b/missing.bin')
+    for jobs in (1, 4):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tree_path = Path(tmpdirname)
+            for relative_path in prune_list[:4]:
+                (tree_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+                (tree_path / relative_path).write_bytes(b'\0')
+            (tree_path / 'b/d.bin').chmod(stat.S_IREAD)
+            (tree_path / 'b/keep.bin').write_bytes(b'\0')
+            unremovable_files = prune_binaries.prune_files(tree_path, prune_list, jobs)
+            assert unremovable_files == {'missing/g.bin', 'b/missing.bin'}
+            assert sorted(path.relative_to(tree_path).as_posix()
+                          for path in tree_path.rglob('*')) == ['b', 'b/e', 'b/keep.bin']
+
+
+def test_prune_dirs():
+    files = (
+        'a/__pycache__/b.pyc',
+        'a/__pycache__/c/d.pyc',
+        'a/e.py',
+        'chrome/test/data/f.html',
+        'chrome/test/data/g/h.bin',
+        'chrome/test/data/g/BUILD.gn',
+        'chrome/test/data/webui/i18n_process_css_test.html',
+        'chrome/test/data/__pycache__/i.pyc',
+        'testing/location_tags.json',
+        'testing/j.json',
+        'build/linux/debian_bullseye_amd64-sysroot/k.so',
+        'build/linux/debian_bullseye_i386-sysroot/l.so',
+        'outside/m.bin',
+    )
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tree_path = Path(tmpdirname)
+        for relative_path in files:
+            (tree_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+            (tree_path / relative_path).write_bytes(b'\0')
+        (tree_path / 'v8/test').mkdir(parents=True)
+        (tree_path / 'v8/test/link').symlink_to(tree_path / 'outside', target_is_directory=True)
+        prune_binaries.prune_dirs(tree_path, False, 'amd64')
+        assert sorted(path.relative_to(tree_path).as_posix() for path in tree_path.rglob('*')) == [
+            'a',
+            'a/__pycache__',
+            'a/e.py',
+            'build',
+            'build/linux',
+            'build/linux/debian_bullseye_amd64-sysroot',
+            'build/linux/debian_bullseye_amd64-sysroot/k.so',
+            'build/linux/debian_bullseye_i386-sysroot',
+            'chrome',
+            'chrome/test',
+            'chrome/test/data',
+            'chrome/test/data/g',
+            'chrome/test/data/g/BUILD.gn',
+            'chrome/test/data/webui',
+            'chrome/test/data/webui/i18n_process_css_test.html',
+            'outside',
+            'outside/m.bin',
+            'testing',
+            'testing/j.json',
+            'v8',
+            'v8/test',
+        ]
+
+
+def test_pruning_matcher():
+    matcher = prune_binaries.PruningMatcher()
+    assert matcher.is_contingent('third_party/llvm')
+    assert matcher.is_contingent('third_party/llvm/llvm/test/a.ll')
+    assert matcher.is_contingent('testing/location_tags.json')
+    assert not matcher.is_contingent('testing/location_tags.json5')
+    assert not matcher.is_contingent('third_party/llvm-foo/a.cc')
+    assert not matcher.is_contingent('third_party')
+    assert matcher.is_kept('v8/test/torque/test-torque.tq')
+    assert matcher.is_kept('v8/test/BUILD.gn')
+    assert not matcher.is_kept('v8/test/.gn')
+    assert not matcher.is_kept('v8/test/a.cc')